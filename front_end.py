@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 from pathlib import Path
 import os
+import json
 from typing import Optional
 
 # Configuration
@@ -35,11 +36,11 @@ def upload_video_to_api(file) -> Optional[dict]:
         st.error(f"Connection error: {str(e)}")
         return None
 
-def process_video_api(session_id: str, email: str) -> Optional[dict]:
+def process_video_api(session_id: str, email: str, mode: str = "chunked") -> Optional[dict]:
     try:
         response = requests.post(
             f"{FASTAPI_BASE_URL}/process",
-            params={"session_id": session_id, "mail": email}
+            params={"session_id": session_id, "mail": email, "mode": mode}
         )
         if response.status_code == 200:
             return response.json()
@@ -50,6 +51,25 @@ def process_video_api(session_id: str, email: str) -> Optional[dict]:
         st.error(f"Connection error: {str(e)}")
         return None
 
+def get_queue_status(session_id: Optional[str] = None) -> Optional[dict]:
+    try:
+        params = {"session_id": session_id} if session_id else None
+        response = requests.get(f"{FASTAPI_BASE_URL}/queue", params=params)
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except requests.exceptions.RequestException:
+        return None
+
+def format_wait(seconds: int) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {secs}s"
+    return f"{secs}s"
+
 def save_edited_subtitle(session_id: str, file_name: str, content: str) -> bool:
     try:
         response = requests.post(
@@ -72,6 +92,16 @@ def finalize_full_srt(session_id: str) -> bool:
         st.error(f"Error finalizing full.srt: {str(e)}")
         return False
 
+def download_subtitles(session_id: str, fmt: str) -> Optional[bytes]:
+    try:
+        response = requests.get(f"{FASTAPI_BASE_URL}/subtitles/{session_id}", params={"format": fmt})
+        if response.status_code == 200:
+            return response.content
+        return None
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error downloading subtitles: {str(e)}")
+        return None
+
 def display_video_player(video_path: str):
     if os.path.exists(video_path):
         with open(video_path, "rb") as video_file:
@@ -92,11 +122,20 @@ def main():
         st.text_input("FastAPI Server URL", value=FASTAPI_BASE_URL)
         st.markdown("---")
         st.markdown("### Supported Formats\n• MP4\n• AVI\n• MKV\n• MOV")
+        st.markdown("---")
+        queue = get_queue_status()
+        if queue:
+            st.markdown("### Processing Queue")
+            st.metric("Jobs waiting", queue["queue_depth"])
+            st.metric("Jobs running", queue["running"])
 
     st.header("📤 Upload Video")
 
     uploaded_file = st.file_uploader("Choose a video file", type=['mp4', 'avi', 'mkv', 'mov'])
     email = st.text_input("Email Address", placeholder="your.email@example.com")
+    long_form = st.checkbox(
+        "Long-form mode (single pass over the whole video, keeps context between scenes)", value=False
+    )
 
     if uploaded_file and email and st.button("🚀 Upload and Start Processing", type="primary"):
         if not is_allowed_file(uploaded_file.name):
@@ -108,8 +147,14 @@ def main():
                     st.session_state.session_id = result['uuid']
                     st.session_state.uploaded_file_path = result['file_path']
                     st.success(f"Uploaded! Session ID: {result['uuid']}")
+                    queue = get_queue_status(result['uuid'])
+                    if queue and queue.get("estimated_start_sec"):
+                        st.info(
+                            f"{queue['position']} job(s) ahead in the queue. "
+                            f"Estimated start in {format_wait(queue['estimated_start_sec'])}."
+                        )
                     with st.spinner("Processing..."):
-                        process = process_video_api(result['uuid'], email)
+                        process = process_video_api(result['uuid'], email, "longform" if long_form else "chunked")
                         if process:
                             st.session_state.processing_status = process
                             st.success("Processing completed!")
@@ -123,12 +168,16 @@ def main():
         srt_dir = UPLOAD_DIR / st.session_state.session_id / "srt"
         chunk_dir = UPLOAD_DIR / st.session_state.session_id / "chunk"
 
-        if srt_dir.exists() and chunk_dir.exists():
-            srt_files = sorted(srt_dir.glob("*.srt"))
-            chunk_files = sorted(chunk_dir.glob("*.mp4"))
+        metadata_path = UPLOAD_DIR / st.session_state.session_id / "metadata.json"
+
+        if srt_dir.exists() and metadata_path.exists():
+            with open(metadata_path, "r", encoding="utf-8") as f:
+                chunks = json.load(f).get("chunks", [])
 
-            for srt_file, chunk_file in zip(srt_files, chunk_files):
-                if srt_file.name == "full.srt":
+            for chunk in chunks:
+                srt_file = srt_dir / f"{chunk['index']}.srt"
+                chunk_file = chunk_dir / f"{chunk['index']}.mp4"
+                if not srt_file.exists():
                     continue
 
                 st.markdown(f"---\n#### 📝 {srt_file.name}")
@@ -166,6 +215,10 @@ def main():
                             st.text_area("📄 full.srt Preview", content, height=300)
                             with open(full_srt_path, "rb") as f:
                                 st.download_button("📅 Download full.srt", f.read(), "full.srt", mime="text/plain")
+                            for fmt in ["vtt", "ass", "json"]:
+                                exported = download_subtitles(st.session_state.session_id, fmt)
+                                if exported:
+                                    st.download_button(f"📅 Download full.{fmt}", exported, f"full.{fmt}", key=f"download_{fmt}")
                     else:
                         st.error("Failed to generate full.srt.")
                 else:
@@ -1,13 +1,22 @@
+import os
 import uuid
 import shutil
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException,Form
+from typing import Optional
+from fastapi import FastAPI, File, UploadFile, HTTPException,Form,Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from preprocess.functions import split_video
-from preprocess.subtitle import translate_chunks_to_srt,merge_srt_chunks
+from fastapi.responses import JSONResponse, FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from preprocess.functions import split_video, decode_audio_window
+from preprocess.metadata import create_session_metadata, load_session_metadata
+from preprocess.subtitle import translate_chunks_to_srt,translate_chunks_with_workers,merge_srt_chunks
+from preprocess.full_movie_sub import transcribe_session_long_form
+from preprocess import broker
+from preprocess.scheduler import JobScheduler, QueueFull
 from preprocess.mail import send_subtitle_completion_email
-from preprocess.update_srt import format_srt_timestamp,shift_srt_timestamps,parse_srt_timestamp
+from preprocess.export import EXPORT_FORMATS, export_subtitles, export_hls_subtitles, negotiate_format
 from fastapi.staticfiles import StaticFiles
 
 app = FastAPI()
@@ -26,6 +35,28 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 # Allowed video formats
 ALLOWED_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov"}
 
+# Whisper model used for transcription
+MODEL_SIZE = "large"
+
+# Highest scheduling priority a /process caller may request. The parameter is
+# not authenticated, so by default nobody can jump the queue.
+MAX_PRIORITY = int(os.environ.get("SUBTITLE_MAX_PRIORITY", 0))
+
+# Admission control for /process: jobs wait here until their estimated
+# memory and CPU fit, and are picked fairly across users
+scheduler = JobScheduler()
+
+# Seconds between admission checks for a waiting job
+ADMISSION_POLL_INTERVAL = 1
+
+# Longest audio window a worker may request from /audio
+MAX_AUDIO_WINDOW_SEC = 600
+
+# Admitted pipelines run here, not in the shared request thread pool, so
+# running jobs can never starve /queue and the other endpoints. The scheduler
+# admits at most one job per core, which bounds the pool.
+pipeline_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="pipeline")
+
 def is_allowed_file(filename: str) -> bool:
     return Path(filename).suffix.lower() in ALLOWED_EXTENSIONS
 
@@ -50,53 +81,162 @@ async def upload_video(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
+    # Probe the container once; every later stage reads this record instead.
+    # The keyframe scan reads every packet, so keep it off the event loop.
+    try:
+        metadata = await run_in_threadpool(create_session_metadata, unique_id, file_path)
+    except Exception as e:
+        shutil.rmtree(UPLOAD_DIR / unique_id, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=f"Could not read video file: {str(e)}")
+
     return JSONResponse(content={
         "message": "Upload successful",
         "file_path": str(file_path),
-        "uuid": unique_id
+        "uuid": unique_id,
+        "duration": metadata["duration"]
     })
 
+def run_pipeline(session_id: str, mail: str, mode: str = "chunked"):
+    # Step 1: Split video (chunks are also used by the review editor in long-form mode).
+    # With a job broker the split runs alongside the workers, see below.
+
+    # # Step 2: Extract and chunk audio
+    # audio_chunks = extract_and_chunk_audio(session_id)
+
+    if mode == "longform":
+        split_video(session_id)
+        #step 2+3: one pass over the whole film, full.srt is written directly
+        file_srt_path = transcribe_session_long_form(session_id, MODEL_SIZE)
+    else:
+        #step 2: hand chunks to worker.py processes when a job broker is configured
+        if broker.BROKER_PATH:
+            # Workers read the original upload, so queue their tasks first and
+            # cut the review editor's video chunks while they transcribe
+            with ThreadPoolExecutor(max_workers=1) as split_pool:
+                split = split_pool.submit(split_video, session_id)
+                translate_chunks_with_workers(session_id, MODEL_SIZE)
+                split.result()
+        else:
+            split_video(session_id)
+            translate_chunks_to_srt(session_id, MODEL_SIZE)
+
+        #step 3:
+        file_srt_path = merge_srt_chunks(session_id)
+
+    #step 4:
+    send_subtitle_completion_email(mail,file_srt_path)
+
+
 @app.post("/process")
-async def process_movie(session_id: str, mail:str):
+async def process_movie(session_id: str, mail:str, priority: int = 0, mode: str = "chunked"):
     """
     Process the uploaded video:
     1. Split the video into 30s chunks
     2. Transcribe the video by whisper
+
+    mode="chunked" (default) transcribes each 30s chunk independently and
+    merges them. mode="longform" streams the whole film through a sliding
+    window that carries context across windows and writes full.srt directly;
+    it runs in the API process, so it is rejected when SUBTITLE_BROKER is set.
+
+    The job first waits in the scheduler queue until there is enough memory and
+    CPU for it. Jobs are shared fairly between users (by mail); a higher
+    priority is scheduled first, capped at SUBTITLE_MAX_PRIORITY.
     """
     session_path = Path("uploads") / session_id
 
     if not session_path.exists():
         raise HTTPException(status_code=404, detail="Session ID not found")
 
-    try:
-        # Step 1: Split video
-
-        split_video(session_id)
+    if mode not in ("chunked", "longform"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Allowed: chunked, longform")
 
-        # # Step 2: Extract and chunk audio
-        # audio_chunks = extract_and_chunk_audio(session_id)
+    # Long-form runs the whole film in this process; with workers configured,
+    # the API host is not sized for that
+    if mode == "longform" and broker.BROKER_PATH:
+        raise HTTPException(status_code=400, detail="Long-form mode is not available when transcription workers are configured")
 
-        #step 2:
-        translate_chunks_to_srt(session_id)
+    try:
+        # Probes the video for sessions uploaded before metadata existed
+        duration = (await run_in_threadpool(load_session_metadata, session_id))["duration"]
 
-        #step 3:
-        file_srt_path = merge_srt_chunks(session_id)
+        try:
+            # With a broker, transcription runs on the workers, not on this host
+            remote = bool(broker.BROKER_PATH)
+            scheduler.submit(session_id, mail, duration, MODEL_SIZE, min(priority, MAX_PRIORITY), remote)
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
 
-        #step 4:
-        send_subtitle_completion_email(mail,file_srt_path)
+        try:
+            # Wait on the event loop; a thread is only taken once the job is admitted
+            while not scheduler.try_acquire(session_id):
+                await asyncio.sleep(ADMISSION_POLL_INTERVAL)
+            await asyncio.get_running_loop().run_in_executor(pipeline_executor, run_pipeline, session_id, mail, mode)
+        finally:
+            scheduler.release(session_id)
 
+        metadata = load_session_metadata(session_id)
         return JSONResponse(content={
             "message": "Subtitle is Ready to use",
             "session_id": session_id,
-            "Total_video_chunk": len(list((session_path / "chunk").glob("*.mp4"))),
-            "Total_subtitle_chunk" : (len(list((session_path / "srt").glob("*.srt"))) -1)
+            "Total_video_chunk": len(metadata["chunks"]),
+            "Total_subtitle_chunk" : len(metadata.get("subtitle_chunks", []))
 
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 
+@app.get("/audio/{session_id}")
+def audio_window(session_id: str, start: float, duration: float):
+    """
+    Serve one window of the session's audio as 16kHz mono s16le PCM, so
+    transcription workers on other machines never need the upload directory.
+    """
+    if start < 0 or not 0 < duration <= MAX_AUDIO_WINDOW_SEC:
+        raise HTTPException(status_code=400, detail=f"Invalid window. duration must be in (0, {MAX_AUDIO_WINDOW_SEC}]")
+
+    if not (UPLOAD_DIR / session_id).exists():
+        raise HTTPException(status_code=404, detail="Session ID not found")
+
+    try:
+        metadata = load_session_metadata(session_id)
+        pcm = decode_audio_window(metadata["media_path"], start, duration)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not decode audio: {str(e)}")
+
+    return Response(content=pcm, media_type="application/octet-stream")
+
+
+@app.get("/queue")
+def queue_status(session_id: Optional[str] = None):
+    """
+    Report scheduler queue depth. With session_id, also report the session's
+    state, position and estimated start time in seconds; a session that has not
+    been submitted yet is estimated as if it were submitted now.
+    """
+    if session_id is None:
+        return scheduler.status()
+
+    status = scheduler.status(session_id)
+    if status["state"] == "unknown":
+        try:
+            duration = load_session_metadata(session_id)["duration"]
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Session ID not found")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        status = scheduler.status(session_id, duration, MODEL_SIZE, bool(broker.BROKER_PATH))
+    return status
+
+
 @app.post("/save-subtitle/")
 def save_subtitle(
     session_id: str = Form(...),
@@ -116,34 +256,59 @@ def save_subtitle(
 def finalize_subtitles(session_id: str = Form(...)):
     try:
         srt_dir = UPLOAD_DIR / session_id / "srt"
-        output_srt = srt_dir / "full.srt"
 
         if not srt_dir.exists():
             raise HTTPException(status_code=404, detail="SRT directory not found")
 
-        chunk_srts = sorted([s for s in srt_dir.glob("*.srt") if s.name != "full.srt"])
+        merge_srt_chunks(session_id)
+
+        return {"message": "Final full.srt generated successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/subtitles/{session_id}")
+def download_subtitles(session_id: str, format: Optional[str] = None, accept: Optional[str] = Header(None)):
+    """
+    Download the session's full subtitles. The format is taken from the
+    `format` query parameter (srt, vtt, ass, json) or negotiated from the
+    Accept header; SRT is the default.
+    """
+    try:
+        fmt = negotiate_format(format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        index = 1
-        with open(output_srt, "w", encoding="utf-8") as outfile:
-            for chunk_index, srt_file in enumerate(chunk_srts):
-                with open(srt_file, "r", encoding="utf-8") as infile:
-                    blocks = infile.read().strip().split("\n\n")
+    try:
+        path = export_subtitles(session_id, fmt)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        # A hand-edited full.srt that no longer parses
+        raise HTTPException(status_code=422, detail=f"Could not convert subtitles: {str(e)}")
 
-                offset_seconds = chunk_index * 30
+    return FileResponse(path, media_type=EXPORT_FORMATS[fmt][1], filename=f"full{EXPORT_FORMATS[fmt][0]}")
 
-                for block in blocks:
-                    if not block.strip():
-                        continue
 
-                    lines = block.strip().splitlines()
-                    if len(lines) < 2:
-                        continue
+@app.get("/subtitles/{session_id}/hls/{file_name}")
+def hls_subtitles(session_id: str, file_name: str):
+    """
+    Serve segmented WebVTT subtitles for HLS players: index.m3u8 and its <n>.vtt segments.
+    """
+    try:
+        playlist_path = export_hls_subtitles(session_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Could not convert subtitles: {str(e)}")
 
-                    # Replace index with global index, shift timestamps
-                    shifted_block = [str(index)] + shift_srt_timestamps("\n".join(lines[1:]), offset_seconds).splitlines()
-                    outfile.write("\n".join(shifted_block) + "\n\n")
-                    index += 1
+    # Only serve names we generated, never a path built from user input
+    served_names = {playlist_path.name} | {p.name for p in playlist_path.parent.glob("*.vtt")}
+    if file_name not in served_names:
+        raise HTTPException(status_code=404, detail="Subtitle segment not found")
+    file_path = playlist_path.parent / file_name
 
-        return {"message": "Final full.srt generated successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    media_type = "application/vnd.apple.mpegurl" if file_path.suffix == ".m3u8" else "text/vtt"
+    return FileResponse(file_path, media_type=media_type)
@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from preprocess import redis_broker
+
+# Job broker that hands chunk transcription to worker.py processes. Set
+# SUBTITLE_BROKER to a redis:// URL for workers on other machines, or to a
+# SQLite database path for workers on this machine only (SQLite locking is not
+# reliable on network filesystems, so keep that database on a local disk).
+BROKER_PATH = os.environ.get("SUBTITLE_BROKER")
+
+# A running task whose worker has not sent a heartbeat for this many seconds
+# is considered abandoned and handed to another worker
+HEARTBEAT_TIMEOUT = 60
+
+# Give up on a task after it has been reassigned this many times
+MAX_ATTEMPTS = 3
+
+
+def redis_url(db_path: str = None):
+
+    """
+    Returns the broker location if it is a Redis URL, otherwise None (SQLite).
+    """
+
+    location = db_path or BROKER_PATH
+    if location and location.startswith(("redis://", "rediss://", "unix://")):
+        return location
+    return None
+
+
+@contextmanager
+def connect(db_path: str = None):
+
+    """
+    Opens the broker database, creating the task table on first use.
+
+    Args:
+        db_path (str): Path to the SQLite database (default: SUBTITLE_BROKER).
+            Redis brokers are handled by preprocess.redis_broker instead.
+
+    Yields:
+        sqlite3.Connection: Connection in autocommit mode; callers open their
+        own transactions when they need atomic updates.
+    """
+
+    db_path = db_path or BROKER_PATH
+    if not db_path:
+        raise RuntimeError("No job broker configured. Set SUBTITLE_BROKER to a SQLite database path.")
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                media_path TEXT NOT NULL,
+                start_sec REAL NOT NULL,
+                duration_sec REAL NOT NULL,
+                model_size TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker_id TEXT,
+                heartbeat REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                UNIQUE (session_id, chunk_index)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL
+            )
+        """)
+        yield conn
+    finally:
+        conn.close()
+
+
+def enqueue_session(session_id: str, media_path: str, windows, model_size: str = "large", db_path: str = None):
+
+    """
+    Queues one transcription task per audio window of a session. Any tasks left
+    over from an earlier run of the same session are replaced.
+
+    Args:
+        session_id (str): UUID of the session
+        media_path (str): Path to the original media, readable by the workers
+        windows (iterable): (chunk_index, start_sec, duration_sec) tuples
+        model_size (str): Whisper model size the workers should load
+        db_path (str): Broker database path or Redis URL (default: SUBTITLE_BROKER)
+
+    Returns:
+        int: Number of queued tasks.
+    """
+
+    windows = list(windows)
+    if redis_url(db_path):
+        redis_broker.enqueue_session(redis_url(db_path), session_id, media_path, windows, model_size)
+        return len(windows)
+
+    with connect(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM tasks WHERE session_id = ?", (session_id,))
+        conn.executemany(
+            "INSERT INTO tasks (session_id, chunk_index, media_path, start_sec, duration_sec, model_size) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(session_id, index, str(media_path), start, duration, model_size) for index, start, duration in windows],
+        )
+        conn.execute("COMMIT")
+    return len(windows)
+
+
+def register_worker(worker_id: str, db_path: str = None):
+
+    """
+    Records that a worker is alive. Workers call this on every poll, busy or
+    idle, so the API can tell an empty worker pool from a busy one.
+    """
+
+    if redis_url(db_path):
+        return redis_broker.register_worker(redis_url(db_path), worker_id)
+
+    with connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO workers (worker_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT (worker_id) DO UPDATE SET last_seen = excluded.last_seen",
+            (worker_id, time.time()),
+        )
+
+
+def live_workers(timeout: float = HEARTBEAT_TIMEOUT, db_path: str = None) -> int:
+
+    """
+    Counts workers seen within the last `timeout` seconds.
+    """
+
+    if redis_url(db_path):
+        return redis_broker.live_workers(redis_url(db_path), timeout)
+
+    with connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM workers WHERE last_seen >= ?", (time.time() - timeout,)
+        ).fetchone()
+    return row[0]
+
+
+def claim_task(worker_id: str, db_path: str = None):
+
+    """
+    Atomically takes the oldest pending task for a worker. Idle workers pull
+    from the same queue, so whichever worker is free next picks up the work.
+
+    Args:
+        worker_id (str): Unique identifier of the calling worker
+        db_path (str): Broker database path or Redis URL (default: SUBTITLE_BROKER)
+
+    Returns:
+        dict | None: The claimed task, or None if the queue is empty.
+    """
+
+    if redis_url(db_path):
+        return redis_broker.claim_task(redis_url(db_path), worker_id)
+
+    with connect(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM tasks WHERE status = 'pending' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE tasks SET status = 'running', worker_id = ?, heartbeat = ?, attempts = attempts + 1 WHERE id = ?",
+            (worker_id, time.time(), row["id"]),
+        )
+        conn.execute("COMMIT")
+
+    task = dict(row)
+    task.update(status="running", worker_id=worker_id, attempts=task["attempts"] + 1)
+    return task
+
+
+def heartbeat(task_id: int, worker_id: str, db_path: str = None) -> bool:
+
+    """
+    Marks a running task as still alive.
+
+    Returns:
+        bool: False if the task was reassigned to another worker in the meantime.
+    """
+
+    if redis_url(db_path):
+        return redis_broker.heartbeat(redis_url(db_path), task_id, worker_id)
+
+    register_worker(worker_id, db_path)
+    with connect(db_path) as conn:
+        cursor = conn.execute(
+            "UPDATE tasks SET heartbeat = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time(), task_id, worker_id),
+        )
+    return cursor.rowcount == 1
+
+
+def complete_task(task_id: int, worker_id: str, segments, db_path: str = None) -> bool:
+
+    """
+    Stores a worker's segments for a task. Results from a worker that lost the
+    task to reassignment are discarded.
+
+    Args:
+        task_id (int): Task identifier
+        worker_id (str): Identifier of the reporting worker
+        segments (list): Segment dicts with "start", "end" and "text" keys,
+            relative to the start of the task's audio window
+
+    Returns:
+        bool: True if the result was accepted.
+    """
+
+    if redis_url(db_path):
+        return redis_broker.complete_task(redis_url(db_path), task_id, worker_id, segments)
+
+    with connect(db_path) as conn:
+        cursor = conn.execute(
+            "UPDATE tasks SET status = 'done', result = ?, heartbeat = ? "
+            "WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (json.dumps(segments), time.time(), task_id, worker_id),
+        )
+    return cursor.rowcount == 1
+
+
+def fail_task(task_id: int, worker_id: str, error: str, db_path: str = None):
+
+    """
+    Returns a task to the queue after a worker error, or marks it failed once
+    it has used up MAX_ATTEMPTS.
+    """
+
+    if redis_url(db_path):
+        return redis_broker.fail_task(redis_url(db_path), task_id, worker_id, error, MAX_ATTEMPTS)
+
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker_id = NULL, error = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (MAX_ATTEMPTS, error, task_id, worker_id),
+        )
+
+
+def requeue_stale_tasks(timeout: float = HEARTBEAT_TIMEOUT, db_path: str = None) -> int:
+
+    """
+    Reassigns running tasks whose worker stopped sending heartbeats.
+
+    Returns:
+        int: Number of tasks returned to the queue or marked failed.
+    """
+
+    if redis_url(db_path):
+        return redis_broker.requeue_stale_tasks(redis_url(db_path), timeout, MAX_ATTEMPTS)
+
+    with connect(db_path) as conn:
+        cursor = conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker_id = NULL, error = 'worker heartbeat lost' "
+            "WHERE status = 'running' AND heartbeat < ?",
+            (MAX_ATTEMPTS, time.time() - timeout),
+        )
+    return cursor.rowcount
+
+
+def session_tasks(session_id: str, db_path: str = None):
+
+    """
+    Lists a session's tasks in chunk order.
+
+    Returns:
+        list[dict]: Tasks with their status, and decoded "segments" once done.
+    """
+
+    if redis_url(db_path):
+        rows = redis_broker.session_tasks(redis_url(db_path), session_id)
+    else:
+        with connect(db_path) as conn:
+            rows = conn.execute(
+                "SELECT * FROM tasks WHERE session_id = ? ORDER BY chunk_index", (session_id,)
+            ).fetchall()
+
+    tasks = []
+    for row in rows:
+        task = dict(row)
+        task["segments"] = json.loads(task["result"]) if task["result"] else None
+        tasks.append(task)
+    return tasks
+
+
+def clear_session(session_id: str, db_path: str = None):
+    if redis_url(db_path):
+        return redis_broker.clear_session(redis_url(db_path), session_id)
+    with connect(db_path) as conn:
+        conn.execute("DELETE FROM tasks WHERE session_id = ?", (session_id,))
@@ -0,0 +1,405 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+
+# Subtitle formats we can export, mapped to (file extension, media type)
+EXPORT_FORMATS = {
+    "srt": (".srt", "application/x-subrip"),
+    "vtt": (".vtt", "text/vtt"),
+    "ass": (".ass", "text/x-ssa"),
+    "json": (".json", "application/json"),
+}
+
+# HLS subtitle segment length in seconds
+HLS_SEGMENT_DURATION = 10
+
+# MPEG-TS timestamp (90kHz clock) that subtitle time 00:00:00.000 maps to in
+# each segment's X-TIMESTAMP-MAP. It must match the first video PTS of the
+# stream the subtitles are played with. 900000 (10s) is a common packager
+# default; ffmpeg-muxed MPEG-TS often starts at 126000 (1.4s), and streams
+# that start at 0 need 0.
+# Segments are cached, so changing this takes effect when full.srt changes.
+HLS_MPEGTS_OFFSET = int(os.environ.get("SUBTITLE_HLS_MPEGTS", 900000))
+
+
+def split_seconds(seconds: float):
+
+    """
+    Splits a time value in seconds into whole hours, minutes, seconds and milliseconds.
+
+    Args:
+        seconds (float): The time value in seconds.
+
+    Returns:
+        tuple: (hours, minutes, seconds, milliseconds) as integers.
+    """
+
+    total_ms = int(round(max(seconds, 0) * 1000))
+    hours, total_ms = divmod(total_ms, 3600000)
+    minutes, total_ms = divmod(total_ms, 60000)
+    secs, millis = divmod(total_ms, 1000)
+    return hours, minutes, secs, millis
+
+
+def format_srt_time(seconds: float) -> str:
+    hours, minutes, secs, millis = split_seconds(seconds)
+    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
+
+
+def format_vtt_time(seconds: float) -> str:
+    hours, minutes, secs, millis = split_seconds(seconds)
+    return f"{hours:02}:{minutes:02}:{secs:02}.{millis:03}"
+
+
+def format_ass_time(seconds: float) -> str:
+    hours, minutes, secs, millis = split_seconds(seconds)
+    return f"{hours}:{minutes:02}:{secs:02}.{millis // 10:02}"
+
+
+def parse_srt_time(timestamp: str) -> float:
+
+    """
+    Parses an SRT timestamp ('HH:MM:SS,mmm') into seconds.
+
+    Args:
+        timestamp (str): The SRT timestamp string.
+
+    Returns:
+        float: The time value in seconds.
+    """
+
+    hours, minutes, rest = timestamp.strip().replace(".", ",").split(":")
+    secs, millis = rest.split(",")
+    return int(hours) * 3600 + int(minutes) * 60 + int(secs) + int(millis) / 1000
+
+
+def read_srt_cues(srt_path, offset_sec: float = 0):
+
+    """
+    Reads cues from an SRT file one block at a time.
+
+    Args:
+        srt_path (str | Path): Path to the SRT file.
+        offset_sec (float): Seconds added to every cue's start and end.
+
+    Yields:
+        dict: Cue with "start", "end" (seconds) and "text" keys, in file order.
+    """
+
+    with open(srt_path, "r", encoding="utf-8") as f:
+        block = []
+        for line in f:
+            if line.strip():
+                block.append(line.rstrip("\n"))
+                continue
+            cue = parse_srt_block(block, offset_sec)
+            if cue:
+                yield cue
+            block = []
+        cue = parse_srt_block(block, offset_sec)
+        if cue:
+            yield cue
+
+
+def parse_srt_block(lines, offset_sec: float = 0):
+
+    """
+    Parses the lines of a single SRT block into a cue.
+
+    Returns:
+        dict | None: The cue, or None if the block has no timing line.
+    """
+
+    for i, line in enumerate(lines):
+        if "-->" in line:
+            try:
+                start, end = [parse_srt_time(t) for t in line.split("-->")]
+            except ValueError:
+                raise ValueError(f"Invalid SRT timing line: {line.strip()!r}")
+            return {
+                "start": start + offset_sec,
+                "end": end + offset_sec,
+                "text": "\n".join(l.strip() for l in lines[i + 1:]),
+            }
+    return None
+
+
+def write_srt(cues, out):
+    for i, cue in enumerate(cues, start=1):
+        out.write(f"{i}\n")
+        out.write(f"{format_srt_time(cue['start'])} --> {format_srt_time(cue['end'])}\n")
+        out.write(cue["text"].strip() + "\n\n")
+
+
+def write_vtt(cues, out):
+    out.write("WEBVTT\n\n")
+    for cue in cues:
+        out.write(f"{format_vtt_time(cue['start'])} --> {format_vtt_time(cue['end'])}\n")
+        out.write(cue["text"].strip() + "\n\n")
+
+
+def write_ass(cues, out):
+    out.write(
+        "[Script Info]\n"
+        "ScriptType: v4.00+\n"
+        "PlayResX: 1920\n"
+        "PlayResY: 1080\n\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+        "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+        "Style: Default,Arial,56,&H00FFFFFF,&H000000FF,&H00000000,&H64000000,"
+        "0,0,0,0,100,100,0,0,1,2,1,2,40,40,40,1\n\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+    for cue in cues:
+        text = cue["text"].strip().replace("\n", "\\N")
+        out.write(
+            f"Dialogue: 0,{format_ass_time(cue['start'])},{format_ass_time(cue['end'])},"
+            f"Default,,0,0,0,,{text}\n"
+        )
+
+
+def write_json(cues, out):
+    # Written cue by cue so large files never need to be held in memory
+    out.write("[")
+    for i, cue in enumerate(cues):
+        if i:
+            out.write(",")
+        out.write("\n  " + json.dumps({
+            "index": i + 1,
+            "start": round(cue["start"], 3),
+            "end": round(cue["end"], 3),
+            "text": cue["text"].strip(),
+        }, ensure_ascii=False))
+    out.write("\n]\n")
+
+
+WRITERS = {
+    "srt": write_srt,
+    "vtt": write_vtt,
+    "ass": write_ass,
+    "json": write_json,
+}
+
+
+def write_cues(cues, output_path, fmt: str = "srt"):
+
+    """
+    Streams cues to a subtitle file in the requested format. The file is
+    written under a temporary name and moved into place once complete, so a
+    failed conversion never leaves a partial file behind.
+
+    Args:
+        cues (iterable): Cue dicts with "start", "end" and "text" keys.
+        output_path (str | Path): Destination file.
+        fmt (str): One of EXPORT_FORMATS ("srt", "vtt", "ass", "json").
+
+    Returns:
+        Path: The written file.
+    """
+
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported subtitle format: {fmt}")
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=output_path.parent,
+                                     prefix=output_path.name + ".", suffix=".tmp", delete=False) as out:
+        try:
+            WRITERS[fmt](cues, out)
+        except BaseException:
+            out.close()
+            os.unlink(out.name)
+            raise
+    os.replace(out.name, output_path)
+    return output_path
+
+
+def export_subtitles(session_id: str, fmt: str, source_name: str = "full.srt"):
+
+    """
+    Converts uploads/<session_id>/srt/full.srt to another format, caching the
+    result in uploads/<session_id>/export/. The cached file is reused until
+    full.srt changes.
+
+    Args:
+        session_id (str): UUID of the session
+        fmt (str): One of EXPORT_FORMATS
+        source_name (str): SRT file to convert (default: full.srt)
+
+    Returns:
+        Path: Path to the exported subtitle file.
+    """
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported subtitle format: {fmt}")
+
+    base_dir = Path("uploads") / session_id
+    source = base_dir / "srt" / source_name
+    if not source.exists():
+        raise FileNotFoundError(f"No subtitles found for session {session_id}")
+
+    if fmt == "srt":
+        return source
+
+    extension = EXPORT_FORMATS[fmt][0]
+    output_path = base_dir / "export" / (Path(source_name).stem + extension)
+    if output_path.exists() and output_path.stat().st_mtime >= source.stat().st_mtime:
+        return output_path
+
+    return write_cues(read_srt_cues(source), output_path, fmt)
+
+
+def export_hls_subtitles(session_id: str, segment_duration: int = HLS_SEGMENT_DURATION,
+                         mpegts_offset: int = HLS_MPEGTS_OFFSET):
+
+    """
+    Splits the session's full.srt into segmented WebVTT files with an HLS
+    media playlist in uploads/<session_id>/export/hls/. Segments are rebuilt
+    only when full.srt changes, into a temporary directory that then replaces
+    hls/, so players never see a half-written playlist or missing segments.
+
+    Args:
+        session_id (str): UUID of the session
+        segment_duration (int): Length of each subtitle segment in seconds
+        mpegts_offset (int): MPEG-TS time of the video's start (see HLS_MPEGTS_OFFSET)
+
+    Returns:
+        Path: Path to the index.m3u8 playlist.
+    """
+
+    base_dir = Path("uploads") / session_id
+    source = base_dir / "srt" / "full.srt"
+    if not source.exists():
+        raise FileNotFoundError(f"No subtitles found for session {session_id}")
+
+    hls_dir = base_dir / "export" / "hls"
+    playlist_path = hls_dir / "index.m3u8"
+    if playlist_path.exists() and playlist_path.stat().st_mtime >= source.stat().st_mtime:
+        return playlist_path
+
+    # A cue spanning a segment boundary is repeated in every segment it overlaps,
+    # as HLS players expect
+    segments = {}
+    last_end = 0
+    for cue in read_srt_cues(source):
+        first = int(cue["start"] // segment_duration)
+        last = max(first, math.ceil(cue["end"] / segment_duration) - 1)
+        for n in range(first, last + 1):
+            segments.setdefault(n, []).append(cue)
+        last_end = max(last_end, cue["end"])
+
+    hls_dir.parent.mkdir(parents=True, exist_ok=True)
+    build_dir = Path(tempfile.mkdtemp(dir=hls_dir.parent, prefix="hls.", suffix=".tmp"))
+    try:
+        write_hls_files(build_dir, segments, last_end, segment_duration, mpegts_offset)
+        replace_directory(build_dir, hls_dir)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    print(f" HLS subtitles saved to: {hls_dir}")
+    return playlist_path
+
+
+def write_hls_files(hls_dir: Path, segments: dict, last_end: float, segment_duration: int, mpegts_offset: int):
+
+    """
+    Writes index.m3u8 and one <n>.vtt per segment into hls_dir.
+
+    Args:
+        segments (dict): Segment number -> cues overlapping that segment.
+        last_end (float): End of the last cue in seconds.
+    """
+
+    segment_count = max(1, math.ceil(last_end / segment_duration))
+    with open(hls_dir / "index.m3u8", "w", encoding="utf-8") as playlist:
+        playlist.write("#EXTM3U\n")
+        playlist.write(f"#EXT-X-TARGETDURATION:{segment_duration}\n")
+        playlist.write("#EXT-X-VERSION:3\n")
+        playlist.write("#EXT-X-MEDIA-SEQUENCE:0\n")
+        playlist.write("#EXT-X-PLAYLIST-TYPE:VOD\n")
+        for n in range(segment_count):
+            with open(hls_dir / f"{n}.vtt", "w", encoding="utf-8") as out:
+                # Cue times stay on the media timeline rather than restarting per segment
+                out.write(f"WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:{mpegts_offset},LOCAL:00:00:00.000\n\n")
+                for cue in segments.get(n, []):
+                    out.write(f"{format_vtt_time(cue['start'])} --> {format_vtt_time(cue['end'])}\n")
+                    out.write(cue["text"].strip() + "\n\n")
+            duration = min(segment_duration, max(last_end - n * segment_duration, 0)) or segment_duration
+            playlist.write(f"#EXTINF:{duration:.3f},\n{n}.vtt\n")
+        playlist.write("#EXT-X-ENDLIST\n")
+
+
+def replace_directory(new_dir: Path, target: Path):
+
+    """
+    Moves a fully built directory to `target`, replacing what is there. The
+    old directory is renamed aside and the new one renamed in, so `target`
+    is only missing between two renames, never partly written.
+    """
+
+    old_dir = None
+    if target.exists():
+        old_dir = target.with_name(f"{target.name}.old.{uuid.uuid4().hex}.tmp")
+        try:
+            target.rename(old_dir)
+        except FileNotFoundError:
+            # Another rebuild moved it away first
+            old_dir = None
+    try:
+        new_dir.rename(target)
+    except OSError:
+        # Another rebuild of the same source put its directory in place first
+        if not target.exists():
+            raise
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def negotiate_format(fmt: str = None, accept: str = None) -> str:
+
+    """
+    Picks the export format from an explicit format name or an Accept header.
+
+    Args:
+        fmt (str): Explicit format or file extension (takes precedence).
+        accept (str): HTTP Accept header value.
+
+    Returns:
+        str: A key of EXPORT_FORMATS. Falls back to "srt".
+    """
+
+    if fmt:
+        fmt = fmt.lower().lstrip(".")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported subtitle format: {fmt}")
+        return fmt
+
+    if accept:
+        ranked = []
+        for position, part in enumerate(accept.split(",")):
+            media_type, _, params = part.strip().partition(";")
+            quality = 1.0
+            for param in params.split(";"):
+                key, _, value = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            ranked.append((-quality, position, media_type.strip().lower()))
+
+        for quality, _, media_type in sorted(ranked):
+            if quality == 0:
+                continue
+            for name, (_, mime) in EXPORT_FORMATS.items():
+                if media_type == mime:
+                    return name
+
+    return "srt"
@@ -1,58 +1,154 @@
 import whisper
+import numpy as np
+from collections import deque
 from pathlib import Path
+from preprocess.export import write_cues
+from preprocess.functions import stream_audio
+from preprocess.metadata import load_session_metadata
+from preprocess.subtitle import split_srt_into_chunks
+
+SAMPLE_RATE = 16000
+
+# Segments Whisper rates above this no-speech probability (its own default
+# threshold) are music, noise or silence and do not lock the source language
+NO_SPEECH_THRESHOLD = 0.6
+
+def stream_long_form_cues(model, media_path: str, window_sec: float = 300, margin_sec: float = 5,
+                          prompt_chars: int = 200, language: str = None):
 
-def format_timestamp(seconds):
     """
-    Convert seconds to SRT timestamp format: HH:MM:SS,mmm
+    Transcribes a whole film in one pass through a sliding window and yields
+    English cues as soon as each window is done.
+
+    The audio is decoded once and buffered only up to `window_sec`. Within a
+    window Whisper conditions on its own previous text; across windows the
+    tail of the committed text is passed as the initial prompt, so names and
+    terms carry over. Segments ending in the last `margin_sec` of a window may
+    be cut mid-sentence, so they are dropped and the next window starts where
+    the last kept segment ended. The language is detected per window until a
+    window commits real speech, then reused for the rest, so a film that opens
+    with music or silence is not translated from a wrongly guessed language.
 
     Args:
-        seconds (float): The time in seconds.
+        model: Loaded Whisper model.
+        media_path (str): Path to the video file.
+        window_sec (float): Audio length transcribed per window.
+        margin_sec (float): Tail of each window whose segments are re-transcribed in the next one.
+        prompt_chars (int): Characters of previous text carried into the next window.
+        language (str): Source language, or None to auto-detect.
 
-    Returns:
-        str: The formatted timestamp as a string in SRT format.
+    Yields:
+        dict: Cue with "start", "end" (seconds from the start of the film) and "text".
     """
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds - int(seconds)) * 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
 
-def transcribe_and_save_srt(video_path: str, model_size: str = "small"):
+    buffer = None
+    offset_sec = 0.0
+    recent_text = deque()
+    blocks = stream_audio(media_path, block_sec=30, sample_rate=SAMPLE_RATE)
+    exhausted = False
+
+    while True:
+        while not exhausted and (buffer is None or len(buffer) < window_sec * SAMPLE_RATE):
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+            else:
+                buffer = block if buffer is None else np.concatenate([buffer, block])
+        if buffer is None or len(buffer) == 0:
+            break
+
+        prompt = " ".join(recent_text)[-prompt_chars:] or None
+        result = model.transcribe(
+            buffer,
+            task="translate",                  # Translate to English
+            language=language,                 # Auto-detect until the language is locked
+            initial_prompt=prompt,             # Context carried over from the previous window
+            condition_on_previous_text=True,
+            fp16=False                         # Set True if using GPU
+        )
+
+        commit_until = float("inf") if exhausted else len(buffer) / SAMPLE_RATE - margin_sec
+        committed_end = 0.0
+        heard_speech = False
+        for segment in result["segments"]:
+            # Always keep the first segment so a window can never stall on one long segment
+            if segment["end"] > commit_until and committed_end > 0:
+                break
+            committed_end = segment["end"]
+            text = segment["text"].strip()
+            if not text:
+                continue
+            if segment.get("no_speech_prob", 0.0) < NO_SPEECH_THRESHOLD:
+                heard_speech = True
+            yield {"start": offset_sec + segment["start"], "end": offset_sec + segment["end"], "text": text}
+            recent_text.append(text)
+            while len(recent_text) > 1 and sum(len(t) + 1 for t in recent_text) > prompt_chars * 2:
+                recent_text.popleft()
+
+        if language is None and heard_speech:
+            language = result.get("language")
+
+        if exhausted:
+            break
+
+        # No speech in the window: move on anyway
+        if committed_end <= 0:
+            committed_end = commit_until
+
+        cut = min(int(committed_end * SAMPLE_RATE), len(buffer))
+        buffer = buffer[cut:]
+        offset_sec += cut / SAMPLE_RATE
+
+
+def transcribe_and_save_srt(video_path: str, model_size: str = "small", output_path: str = None):
     """
     Transcribes the audio from a video file, translates it to English, and saves the result as an SRT subtitle file.
     Args:
         video_path (str): The path to the video file to be transcribed.
         model_size (str, optional): The size of the Whisper model to use for transcription (e.g., "small", "medium", "large"). Defaults to "small".
+        output_path (str, optional): Where to write the SRT file. Defaults to the video path with a .srt suffix.
     Returns:
         Path: The path to the generated SRT subtitle file.
     Raises:
         FileNotFoundError: If the specified video file does not exist.
         Exception: If transcription or file writing fails.
     Note:
-        This function uses the OpenAI Whisper model for transcription and translation. The output SRT file will be saved in the same directory as the input video, with the same base name.
+        This function uses the OpenAI Whisper model for transcription and translation. The film is streamed through
+        stream_long_form_cues, so cues are written as each window finishes and memory stays bounded for long films.
     """
 
-
-    model = whisper.load_model(model_size)
-    result = model.transcribe(video_path, task="translate",)
-
-    # Prepare output path
     video_file = Path(video_path)
-    srt_path = video_file.with_suffix(".srt")
+    if not video_file.exists():
+        raise FileNotFoundError(f"Video file not found: {video_path}")
 
-    # Write SRT file
-    with open(srt_path, "w", encoding="utf-8") as f:
-        for i, segment in enumerate(result["segments"], start=1):
-            start = format_timestamp(segment["start"])
-            end = format_timestamp(segment["end"])
-            text = segment["text"].strip()
+    model = whisper.load_model(model_size)
+    srt_path = Path(output_path) if output_path else video_file.with_suffix(".srt")
 
-            f.write(f"{i}\n")
-            f.write(f"{start} --> {end}\n")
-            f.write(f"{text}\n\n")
+    write_cues(stream_long_form_cues(model, str(video_file)), srt_path, "srt")
 
     print(f" Subtitle saved to: {srt_path}")
     return srt_path
 
-# Example usage
-# transcribe_and_save_srt("uploads/7f11a2b6-e7cb-46fa-8729-9d0b67e18d9d/original_file/SSYouTube.online_F1 _ Official Trailer_720p.mp4")
+
+def transcribe_session_long_form(session_id: str, model_size: str = "large"):
+
+    """
+    Long-form alternative to translate_chunks_to_srt + merge_srt_chunks. Writes
+    uploads/<session_id>/srt/full.srt directly with global timestamps, then
+    splits it into per-chunk SRT files so chunks can still be reviewed and
+    edited.
+
+    Args:
+        session_id (str): UUID of the session
+        model_size (str): Whisper model size ("tiny", "base", "small", "medium", "large")
+
+    Returns:
+        Path: Path to full.srt.
+    """
+
+    metadata = load_session_metadata(session_id)
+    output_path = Path("uploads") / session_id / "srt" / "full.srt"
+
+    transcribe_and_save_srt(metadata["media_path"], model_size, output_path)
+    split_srt_into_chunks(session_id, metadata.get("chunk_duration", 30))
+    return output_path
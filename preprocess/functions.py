@@ -2,40 +2,59 @@ import os
 import subprocess
 from pathlib import Path
 from pydub import AudioSegment
-from moviepy import VideoFileClip
+from preprocess.metadata import load_session_metadata, update_session_metadata, nearest_keyframe, chunk_windows
+from preprocess.scheduler import SPLIT_THREADS
 
 def split_video(session_id: str, chunk_duration: int = 30):
 
     """
     Splits the video associated with a session_id into 30-second chunks.
 
+    Duration and keyframes come from the session metadata recorded at upload,
+    so the source is never opened just to inspect it. Each chunk is cut by
+    seeking to the keyframe before its start and decoding only from there.
+    ffmpeg is limited to SPLIT_THREADS threads, the cores the scheduler
+    reserves for the split, instead of taking every core. The chunk list is stored back in the metadata for later stages.
+
     Args:
         session_id (str): Session identifier to locate the video file.
         chunk_duration (int): Duration of each chunk in seconds.
-    """
 
+    Returns:
+        list[dict]: Chunks with "index", "start", "duration" and "path".
+    """
 
-    input_dir = os.path.join("uploads", session_id, "original_file")
+    metadata = load_session_metadata(session_id)
     output_dir = os.path.join("uploads", session_id, "chunk")
     os.makedirs(output_dir, exist_ok=True)
 
-    # Find video file
-    video_files = [f for f in os.listdir(input_dir) if f.lower().endswith((".mp4", ".mov", ".avi", ".mkv"))]
-    if not video_files:
-        raise FileNotFoundError(f"Please enter a valid Session ID {session_id}")
-
-    input_video_path = os.path.join(input_dir, video_files[0])
-    video = VideoFileClip(input_video_path)
-    total_duration = int(video.duration)
+    input_video_path = metadata["media_path"]
 
     # Split into chunks
-    for i, start_time in enumerate(range(0, total_duration, chunk_duration)):
-        end_time = min(start_time + chunk_duration, total_duration)
-        clip = video.subclipped(start_time, end_time)
-        clip.write_videofile(os.path.join(output_dir, f"{i+1}.mp4"), codec="libx264", audio_codec="aac", logger=None)
-
-    video.close()
+    chunks = []
+    for index, start_time, duration in chunk_windows(metadata["duration"], chunk_duration):
+        chunk_path = os.path.join(output_dir, f"{index}.mp4")
+        keyframe = nearest_keyframe(metadata, start_time)
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-nostdin",
+            "-threads", str(SPLIT_THREADS),           # decoder threads
+            "-ss", f"{keyframe:.3f}",                 # jump straight to the keyframe
+            "-i", input_video_path,
+            "-ss", f"{start_time - keyframe:.3f}",    # then decode up to the exact start
+            "-t", f"{duration:.3f}",
+            "-c:v", "libx264",
+            "-c:a", "aac",
+            "-threads", str(SPLIT_THREADS),           # encoder threads
+            chunk_path
+        ]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        chunks.append({"index": index, "start": start_time, "duration": duration, "path": chunk_path})
+
+    update_session_metadata(session_id, chunks=chunks, chunk_duration=chunk_duration)
     print(f" Split complete for session: {session_id}")
+    return chunks
 
 
 def extract_and_chunk_audio(session_id: str, chunk_length_sec: int = 30):
@@ -96,3 +115,101 @@ def extract_and_chunk_audio(session_id: str, chunk_length_sec: int = 30):
     print(f" Done! Extracted {len(chunk_paths)} audio chunks to {output_dir}")
     return chunk_paths
 
+
+
+def decode_audio_window(media_path: str, start_sec: float, duration_sec: float, sample_rate: int = 16000) -> bytes:
+
+    """
+    Decodes one window of a media file's audio straight from the source, without
+    writing chunk files.
+
+    Args:
+        media_path (str): Path to the video or audio file.
+        start_sec (float): Window start in seconds.
+        duration_sec (float): Window length in seconds.
+        sample_rate (int): Output sample rate (Whisper expects 16kHz).
+
+    Returns:
+        bytes: Mono signed 16-bit little-endian PCM.
+    """
+
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-ss", str(start_sec),     # input seek, jumps to the nearest keyframe first
+        "-t", str(duration_sec),
+        "-i", str(media_path),
+        "-vn",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "-f", "s16le",
+        "-"
+    ]
+    return subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+
+
+def pcm_to_float(data: bytes):
+
+    """
+    Converts s16le PCM to the float32 samples in [-1, 1] Whisper takes.
+    """
+
+    import numpy as np
+
+    return np.frombuffer(data[:len(data) - len(data) % 2], np.int16).astype(np.float32) / 32768.0
+
+
+def load_audio_window(media_path: str, start_sec: float, duration_sec: float, sample_rate: int = 16000):
+
+    """
+    Decodes one window of a local media file's audio, see decode_audio_window.
+    Used by workers that receive tasks by reference.
+
+    Returns:
+        numpy.ndarray: Mono float32 samples in [-1, 1].
+    """
+
+    return pcm_to_float(decode_audio_window(media_path, start_sec, duration_sec, sample_rate))
+
+
+def stream_audio(media_path: str, block_sec: float = 30, sample_rate: int = 16000):
+
+    """
+    Decodes a media file's audio with a single ffmpeg process and yields it in
+    fixed-size blocks, so long films never have to be held in memory at once.
+
+    Args:
+        media_path (str): Path to the video or audio file.
+        block_sec (float): Length of each yielded block in seconds.
+        sample_rate (int): Output sample rate (Whisper expects 16kHz).
+
+    Yields:
+        numpy.ndarray: Mono float32 samples in [-1, 1]; the last block may be shorter.
+    """
+
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-i", str(media_path),
+        "-vn",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "-f", "s16le",
+        "-"
+    ]
+    block_bytes = int(block_sec * sample_rate) * 2
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield pcm_to_float(data)
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+    finally:
+        # Stop ffmpeg if the consumer stopped reading early
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
@@ -0,0 +1,236 @@
+import bisect
+import json
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+# Per-session media record written once at upload time
+METADATA_FILENAME = "metadata.json"
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv")
+
+# Serialises read-modify-write updates, e.g. split_video recording chunks while
+# the broker coordinator records subtitle chunks for the same session
+metadata_lock = threading.Lock()
+
+
+def probe_media(media_path: str):
+
+    """
+    Reads a media file's container and stream information with ffprobe.
+    Only packet headers are scanned for the keyframe index; no frames are decoded.
+
+    Args:
+        media_path (str): Path to the video file.
+
+    Returns:
+        dict: "duration", "format", "size", "start_time", "video" and "audio"
+        stream details (codec, resolution, frame rate, sample rate, channels)
+        and "keyframes", a sorted list of video keyframe times in seconds from
+        the start of the file, the timeline ffmpeg's -ss seeks on.
+    """
+
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        str(media_path)
+    ]
+    info = json.loads(subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout)
+
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    metadata = {
+        "media_path": str(media_path),
+        "format": info["format"].get("format_name"),
+        "duration": float(info["format"].get("duration", 0)),
+        "size": int(info["format"].get("size", 0)),
+        # First timestamp in the container; not 0 for e.g. some MKV and MPEG-TS files
+        "start_time": float(info["format"].get("start_time", 0)),
+        "video": None,
+        "audio": None,
+        "keyframes": [],
+    }
+
+    if video:
+        metadata["video"] = {
+            "index": video["index"],
+            "codec": video.get("codec_name"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "frame_rate": parse_rate(video.get("avg_frame_rate")),
+        }
+        metadata["keyframes"] = probe_keyframes(media_path, metadata["start_time"])
+
+    if audio:
+        metadata["audio"] = {
+            "index": audio["index"],
+            "codec": audio.get("codec_name"),
+            "sample_rate": int(audio.get("sample_rate", 0)),
+            "channels": audio.get("channels"),
+        }
+
+    return metadata
+
+
+def probe_keyframes(media_path: str, start_time: float = 0.0):
+
+    """
+    Lists the presentation times of the first video stream's keyframes.
+
+    Args:
+        media_path (str): Path to the video file.
+        start_time (float): The container's start_time. Packet times are
+            absolute, while ffmpeg's input -ss counts from the start of the
+            file, so it is subtracted.
+
+    Returns:
+        list[float]: Keyframe times in seconds from the start of the file, ascending.
+    """
+
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=print_section=0",
+        str(media_path)
+    ]
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+
+    keyframes = []
+    for line in out.decode().splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(max(float(pts_time) - start_time, 0.0))
+    return sorted(keyframes)
+
+
+def parse_rate(rate: str):
+    if not rate or rate == "0/0":
+        return None
+    num, _, den = rate.partition("/")
+    return float(num) / float(den or 1)
+
+
+def nearest_keyframe(metadata: dict, seconds: float) -> float:
+
+    """
+    Returns the last keyframe at or before `seconds`, so a seek can start
+    decoding there instead of from the beginning of the file.
+    """
+
+    keyframes = metadata.get("keyframes") or []
+    i = bisect.bisect_right(keyframes, seconds)
+    return keyframes[i - 1] if i else 0.0
+
+
+def chunk_windows(duration: float, chunk_duration: int = 30):
+
+    """
+    Lists the fixed-size windows a video of `duration` seconds is cut into.
+    split_video and the broker coordinator both use it, so chunk N always
+    covers the same audio.
+
+    Returns:
+        list[tuple]: (chunk_index, start_sec, duration_sec), indices from 1.
+    """
+
+    return [
+        (i + 1, start, min(chunk_duration, duration - start))
+        for i, start in enumerate(range(0, int(duration), chunk_duration))
+    ]
+
+
+def find_original_video(session_id: str) -> Path:
+    input_dir = Path("uploads") / session_id / "original_file"
+    video_files = [f for f in input_dir.glob("*") if f.suffix.lower() in VIDEO_EXTENSIONS] if input_dir.exists() else []
+    if not video_files:
+        raise FileNotFoundError(f"Please enter a valid Session ID {session_id}")
+    return video_files[0]
+
+
+def create_session_metadata(session_id: str, media_path: str = None):
+
+    """
+    Probes the session's uploaded video once and stores the result in
+    uploads/<session_id>/metadata.json for every later stage to read.
+
+    Args:
+        session_id (str): UUID of the session
+        media_path (str): Path to the uploaded video (default: found in original_file/)
+
+    Returns:
+        dict: The session metadata.
+    """
+
+    media_path = Path(media_path) if media_path else find_original_video(session_id)
+    metadata = probe_media(media_path)
+    metadata["media_path"] = str(media_path.resolve())
+    metadata["chunks"] = []
+    save_session_metadata(session_id, metadata)
+    return metadata
+
+
+def load_session_metadata(session_id: str):
+
+    """
+    Reads the session's metadata record, probing the video if the session was
+    uploaded before metadata existed.
+
+    Returns:
+        dict: The session metadata.
+    """
+
+    path = Path("uploads") / session_id / METADATA_FILENAME
+    if not path.exists():
+        return create_session_metadata(session_id)
+    with open(path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    # Records written before start_time was stored hold absolute keyframe times
+    if "start_time" not in metadata and metadata.get("keyframes"):
+        metadata.update(probe_media(metadata["media_path"]))
+        save_session_metadata(session_id, metadata)
+    return metadata
+
+
+def save_session_metadata(session_id: str, metadata: dict):
+
+    """
+    Writes the metadata record atomically. Each call writes its own temporary
+    file, so concurrent writers (e.g. /queue and /process back-filling the
+    same session) never replace each other's half-written file.
+    """
+
+    path = Path("uploads") / session_id / METADATA_FILENAME
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent,
+                                     prefix=path.stem + ".", suffix=".tmp", delete=False) as f:
+        try:
+            json.dump(metadata, f, indent=2)
+        except BaseException:
+            f.close()
+            Path(f.name).unlink()
+            raise
+    Path(f.name).replace(path)
+
+
+def update_session_metadata(session_id: str, **fields):
+
+    """
+    Merges fields (e.g. the chunk list written by split_video) into the session's metadata.
+
+    Returns:
+        dict: The updated metadata.
+    """
+
+    with metadata_lock:
+        metadata = load_session_metadata(session_id)
+        metadata.update(fields)
+        save_session_metadata(session_id, metadata)
+    return metadata
@@ -0,0 +1,221 @@
+import json
+import time
+
+# Redis job broker used by preprocess.broker when SUBTITLE_BROKER is a
+# redis:// URL. Unlike the SQLite file it can be reached over the network, so
+# workers can run on other machines. Every state change is a WATCH/MULTI
+# transaction on the task, so two workers can never hold the same task.
+
+PREFIX = "subtitle:"
+PENDING_KEY = PREFIX + "pending"      # list of task ids, oldest first
+RUNNING_KEY = PREFIX + "running"      # sorted set of task ids by last heartbeat
+WORKERS_KEY = PREFIX + "workers"      # sorted set of worker ids by last seen
+TASK_ID_KEY = PREFIX + "task_id"
+
+INT_FIELDS = ("id", "chunk_index", "attempts")
+FLOAT_FIELDS = ("start_sec", "duration_sec", "heartbeat")
+
+clients = {}
+
+
+def connect(url: str):
+
+    """
+    Returns a Redis client for the broker URL, reusing one connection pool per URL.
+    """
+
+    if url not in clients:
+        import redis
+        clients[url] = redis.Redis.from_url(url, decode_responses=True)
+    return clients[url]
+
+
+def task_key(task_id) -> str:
+    return f"{PREFIX}task:{task_id}"
+
+
+def session_key(session_id: str) -> str:
+    return f"{PREFIX}session:{session_id}"
+
+
+def decode_task(fields: dict):
+    task = {
+        "worker_id": None, "heartbeat": None, "result": None, "error": None,
+        **fields,
+    }
+    for name in INT_FIELDS:
+        task[name] = int(task[name])
+    for name in FLOAT_FIELDS:
+        if task[name] is not None:
+            task[name] = float(task[name])
+    return task
+
+
+def update_task(conn, task_id: int, change):
+
+    """
+    Applies `change` to a task atomically. `change(task, pipe)` gets the
+    current task (or None if it no longer exists) and queues its writes on the
+    pipeline; it returns False to leave the task untouched. The transaction is
+    retried if the task changes in the meantime.
+
+    Returns:
+        bool: True if the change was applied.
+    """
+
+    key = task_key(task_id)
+
+    def transaction(pipe):
+        fields = pipe.hgetall(key)
+        task = decode_task(fields) if fields else None
+        pipe.multi()
+        return change(task, pipe) is not False
+
+    return conn.transaction(transaction, key, value_from_callable=True)
+
+
+def release_task(task, pipe, max_attempts: int, error: str):
+
+    """
+    Queues the writes that put a running task back in the queue, or mark it
+    failed once it has used up max_attempts.
+    """
+
+    if task["attempts"] >= max_attempts:
+        pipe.hset(task_key(task["id"]), mapping={"status": "failed", "error": error})
+    else:
+        pipe.hset(task_key(task["id"]), mapping={"status": "pending", "error": error})
+        pipe.rpush(PENDING_KEY, task["id"])
+    pipe.hdel(task_key(task["id"]), "worker_id")
+    pipe.zrem(RUNNING_KEY, task["id"])
+
+
+def enqueue_session(url: str, session_id: str, media_path: str, windows, model_size: str):
+    conn = connect(url)
+    clear_session(url, session_id)
+
+    pipe = conn.pipeline()
+    for index, start, duration in windows:
+        task_id = conn.incr(TASK_ID_KEY)
+        pipe.hset(task_key(task_id), mapping={
+            "id": task_id,
+            "session_id": session_id,
+            "chunk_index": index,
+            "media_path": str(media_path),
+            "start_sec": start,
+            "duration_sec": duration,
+            "model_size": model_size,
+            "status": "pending",
+            "attempts": 0,
+        })
+        pipe.sadd(session_key(session_id), task_id)
+        pipe.rpush(PENDING_KEY, task_id)
+    pipe.execute()
+
+
+def register_worker(url: str, worker_id: str):
+    connect(url).zadd(WORKERS_KEY, {worker_id: time.time()})
+
+
+def live_workers(url: str, timeout: float) -> int:
+    return connect(url).zcount(WORKERS_KEY, time.time() - timeout, "+inf")
+
+
+def claim_task(url: str, worker_id: str):
+    conn = connect(url)
+
+    def transaction(pipe):
+        task_id = pipe.lindex(PENDING_KEY, 0)
+        if task_id is None:
+            pipe.multi()
+            return None
+        fields = pipe.hgetall(task_key(task_id))
+        now = time.time()
+        pipe.multi()
+        pipe.lpop(PENDING_KEY)
+        # The session was cleared while the id was queued: drop it
+        if not fields or fields["status"] != "pending":
+            return False
+        task = decode_task(fields)
+        task.update(status="running", worker_id=worker_id, heartbeat=now, attempts=task["attempts"] + 1)
+        pipe.hset(task_key(task_id), mapping={
+            "status": "running", "worker_id": worker_id, "heartbeat": now, "attempts": task["attempts"],
+        })
+        pipe.zadd(RUNNING_KEY, {task_id: now})
+        return task
+
+    while True:
+        # Watch the queue head, so only one worker can pop and mark a task
+        task = conn.transaction(transaction, PENDING_KEY, value_from_callable=True)
+        if task is not False:
+            return task
+
+
+def heartbeat(url: str, task_id: int, worker_id: str) -> bool:
+    def change(task, pipe):
+        if task is None or task["status"] != "running" or task["worker_id"] != worker_id:
+            return False
+        now = time.time()
+        pipe.hset(task_key(task_id), "heartbeat", now)
+        pipe.zadd(RUNNING_KEY, {task_id: now})
+
+    register_worker(url, worker_id)
+    return update_task(connect(url), task_id, change)
+
+
+def complete_task(url: str, task_id: int, worker_id: str, segments) -> bool:
+    def change(task, pipe):
+        if task is None or task["status"] != "running" or task["worker_id"] != worker_id:
+            return False
+        pipe.hset(task_key(task_id), mapping={
+            "status": "done", "result": json.dumps(segments), "heartbeat": time.time(),
+        })
+        pipe.zrem(RUNNING_KEY, task_id)
+
+    return update_task(connect(url), task_id, change)
+
+
+def fail_task(url: str, task_id: int, worker_id: str, error: str, max_attempts: int):
+    def change(task, pipe):
+        if task is None or task["status"] != "running" or task["worker_id"] != worker_id:
+            return False
+        release_task(task, pipe, max_attempts, error)
+
+    update_task(connect(url), task_id, change)
+
+
+def requeue_stale_tasks(url: str, timeout: float, max_attempts: int) -> int:
+    conn = connect(url)
+    cutoff = time.time() - timeout
+
+    def change(task, pipe):
+        # Re-check under the transaction: the worker may have just sent a heartbeat
+        if task is None or task["status"] != "running" or task["heartbeat"] >= cutoff:
+            return False
+        release_task(task, pipe, max_attempts, "worker heartbeat lost")
+
+    return sum(
+        update_task(conn, task_id, change)
+        for task_id in conn.zrangebyscore(RUNNING_KEY, "-inf", f"({cutoff}")
+    )
+
+
+def session_tasks(url: str, session_id: str):
+    conn = connect(url)
+    pipe = conn.pipeline()
+    for task_id in conn.smembers(session_key(session_id)):
+        pipe.hgetall(task_key(task_id))
+    tasks = [decode_task(fields) for fields in pipe.execute() if fields]
+    return sorted(tasks, key=lambda task: task["chunk_index"])
+
+
+def clear_session(url: str, session_id: str):
+    conn = connect(url)
+    task_ids = conn.smembers(session_key(session_id))
+    pipe = conn.pipeline()
+    for task_id in task_ids:
+        pipe.delete(task_key(task_id))
+        pipe.lrem(PENDING_KEY, 0, task_id)
+        pipe.zrem(RUNNING_KEY, task_id)
+    pipe.delete(session_key(session_id))
+    pipe.execute()
@@ -0,0 +1,296 @@
+import itertools
+import os
+import threading
+import time
+
+# Approximate peak memory (GB) of each Whisper model while transcribing,
+# plus decoding overhead
+MODEL_MEMORY_GB = {
+    "tiny": 1.5,
+    "base": 1.5,
+    "small": 2.5,
+    "medium": 5.5,
+    "large": 10.5,
+}
+
+# Cores a job on each model keeps busy
+MODEL_CORES = {
+    "tiny": 1,
+    "base": 2,
+    "small": 4,
+    "medium": 8,
+    "large": 8,
+}
+
+# Transcription seconds per second of media on CPU
+MODEL_REALTIME_FACTOR = {
+    "tiny": 0.15,
+    "base": 0.25,
+    "small": 0.6,
+    "medium": 1.5,
+    "large": 3.0,
+}
+
+# Every job re-encodes its video into chunks with ffmpeg on the API host
+# (split_video), also when transcription runs on broker workers. The split's
+# ffmpeg is limited to SPLIT_THREADS threads, so the cores reserved for a job
+# match what its split really uses.
+SPLIT_THREADS = int(os.environ.get("SUBTITLE_SPLIT_THREADS", 2))
+SPLIT_MEMORY_GB = 0.5
+
+# Split seconds per second of media at SPLIT_THREADS threads
+SPLIT_REALTIME_FACTOR = 0.25
+
+# Jobs allowed to wait in the queue at once; further submissions are rejected
+MAX_QUEUED_JOBS = int(os.environ.get("SUBTITLE_MAX_QUEUED_JOBS", 20))
+
+# Seconds of waiting that offset one second of estimated runtime when ordering
+# a user's queue, so long jobs are not starved by a stream of short ones
+AGING_FACTOR = 0.5
+
+
+class QueueFull(Exception):
+    """Raised by JobScheduler.submit when MAX_QUEUED_JOBS jobs are already waiting."""
+
+
+def total_memory_gb() -> float:
+
+    """
+    Memory budget for concurrent jobs: SUBTITLE_MEMORY_GB if set, otherwise
+    80% of physical memory.
+    """
+
+    if os.environ.get("SUBTITLE_MEMORY_GB"):
+        return float(os.environ["SUBTITLE_MEMORY_GB"])
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3 * 0.8
+    except (ValueError, OSError, AttributeError):
+        return 16.0
+
+
+def estimate_job_cost(duration_sec: float, model_size: str, remote: bool = False):
+
+    """
+    Estimates the resources a job needs from its media duration and model size.
+
+    Args:
+        duration_sec (float): Media duration in seconds.
+        model_size (str): Whisper model size.
+        remote (bool): Transcription runs on broker workers, so the local host
+            only pays for splitting the video, alongside the workers.
+
+    Returns:
+        dict: "memory_gb", "cores" and "runtime_sec" estimates. The runtime is
+        the whole job either way, since the slot is held until it finishes.
+    """
+
+    model = model_size.split(".")[0].split("-")[0]  # "large-v3" -> "large"
+    duration_sec = max(duration_sec, 1)
+    transcribe_sec = duration_sec * MODEL_REALTIME_FACTOR.get(model, MODEL_REALTIME_FACTOR["large"])
+    split_sec = duration_sec * SPLIT_REALTIME_FACTOR
+    cpu_count = os.cpu_count() or 1
+    if remote:
+        return {
+            "memory_gb": SPLIT_MEMORY_GB,
+            "cores": min(SPLIT_THREADS, cpu_count),
+            "runtime_sec": max(transcribe_sec, split_sec),
+        }
+    # The split runs first, then transcription: cores are the larger of the
+    # two, runtime is their sum
+    return {
+        "memory_gb": max(MODEL_MEMORY_GB.get(model, MODEL_MEMORY_GB["large"]), SPLIT_MEMORY_GB),
+        "cores": min(max(MODEL_CORES.get(model, MODEL_CORES["large"]), SPLIT_THREADS), cpu_count),
+        "runtime_sec": split_sec + transcribe_sec,
+    }
+
+
+class JobScheduler:
+
+    """
+    Admits processing jobs only while their estimated memory and CPU fit in the
+    machine's budget, and picks the next job fairly across users.
+
+    Queued jobs are ordered by priority first (higher runs first), then by how
+    much work each user has already had served, then by estimated runtime, so
+    a short trailer is not stuck behind a long film. A job is always admitted
+    when nothing else is running, even if it exceeds the budget on its own.
+    """
+
+    def __init__(self, memory_gb: float = None, cores: int = None, max_queued: int = None):
+        self.memory_gb = memory_gb or total_memory_gb()
+        self.cores = cores or os.cpu_count() or 1
+        self.max_queued = max_queued or MAX_QUEUED_JOBS
+        self.lock = threading.Lock()
+        self.queued = {}
+        self.running = {}
+        self.served = {}
+        self.counter = itertools.count()
+
+    def submit(self, session_id: str, user: str, duration_sec: float, model_size: str, priority: int = 0,
+               remote: bool = False):
+
+        """
+        Adds a job to its user's queue.
+
+        Args:
+            session_id (str): UUID of the session
+            user (str): Owner of the job (used for fair sharing)
+            duration_sec (float): Media duration in seconds
+            model_size (str): Whisper model size the job will load
+            priority (int): Higher values are scheduled first
+            remote (bool): Transcription runs on broker workers
+
+        Raises:
+            ValueError: If the session is already queued or running.
+            QueueFull: If max_queued jobs are already waiting.
+        """
+
+        with self.lock:
+            if session_id in self.queued or session_id in self.running:
+                raise ValueError(f"Session {session_id} is already scheduled")
+            if len(self.queued) >= self.max_queued:
+                raise QueueFull(f"{len(self.queued)} jobs are already waiting, try again later")
+            job = {
+                "session_id": session_id,
+                "user": user,
+                "priority": priority,
+                "submitted": time.time(),
+                "seq": next(self.counter),
+                **estimate_job_cost(duration_sec, model_size, remote),
+            }
+            if not self.has_jobs(user):
+                self.served[user] = self.service_floor()
+            self.queued[session_id] = job
+            return job
+
+    def has_jobs(self, user: str) -> bool:
+        return any(j["user"] == user for j in itertools.chain(self.queued.values(), self.running.values()))
+
+    def service_floor(self) -> float:
+
+        """
+        Least work served to any user with jobs in flight. A user returning
+        after being idle starts from here, so past usage is neither held
+        against them forever nor banked as credit.
+        """
+
+        active_users = {j["user"] for j in itertools.chain(self.queued.values(), self.running.values())}
+        return min((self.served[u] for u in active_users), default=0)
+
+    def order(self, jobs, served, now):
+        return sorted(jobs, key=lambda job: (
+            -job["priority"],
+            served.get(job["user"], 0),
+            job["runtime_sec"] - (now - job["submitted"]) * AGING_FACTOR,
+            job["seq"],
+        ))
+
+    def fits(self, job) -> bool:
+        if not self.running:
+            return True
+        memory = sum(j["memory_gb"] for j in self.running.values())
+        cores = sum(j["cores"] for j in self.running.values())
+        return memory + job["memory_gb"] <= self.memory_gb and cores + job["cores"] <= self.cores
+
+    def next_job(self):
+        queue = self.order(self.queued.values(), self.served, time.time())
+        return queue[0] if queue else None
+
+    def try_acquire(self, session_id: str) -> bool:
+
+        """
+        Marks the job running if it is next in line and fits in the budget.
+        Never blocks, so callers can wait without holding a thread (e.g. by
+        polling from the event loop).
+
+        Returns:
+            bool: True if the job was admitted.
+        """
+
+        with self.lock:
+            job = self.next_job()
+            if not job or job["session_id"] != session_id or not self.fits(job):
+                return False
+
+            del self.queued[session_id]
+            job["started"] = time.time()
+            self.running[session_id] = job
+            self.served[job["user"]] += job["runtime_sec"]
+            return True
+
+    def release(self, session_id: str):
+
+        """
+        Removes a job whether it is still queued or running.
+        """
+
+        with self.lock:
+            self.queued.pop(session_id, None)
+            self.running.pop(session_id, None)
+
+    def status(self, session_id: str = None, duration_sec: float = None, model_size: str = None,
+               remote: bool = False):
+
+        """
+        Reports queue depth and, for one session, its position and estimated start.
+
+        The start estimate replays the queue in scheduling order against the
+        running jobs' estimated finish times. For a session that has not been
+        submitted yet, pass its duration and model to get the estimate it would
+        have if submitted now.
+
+        Returns:
+            dict: Queue summary; "state", "position" and "estimated_start_sec"
+            are included when session_id is given.
+        """
+
+        with self.lock:
+            now = time.time()
+            status = {
+                "queue_depth": len(self.queued),
+                "running": len(self.running),
+                "memory_gb_in_use": round(sum(j["memory_gb"] for j in self.running.values()), 1),
+                "memory_gb_total": round(self.memory_gb, 1),
+            }
+            if session_id is None:
+                return status
+
+            if session_id in self.running:
+                return {**status, "state": "running", "position": 0, "estimated_start_sec": 0}
+
+            queued = dict(self.queued)
+            if session_id not in queued:
+                if duration_sec is None or model_size is None:
+                    return {**status, "state": "unknown", "position": None, "estimated_start_sec": None}
+                queued[session_id] = {
+                    "session_id": session_id, "user": session_id, "priority": 0,
+                    "submitted": now, "seq": float("inf"), **estimate_job_cost(duration_sec, model_size, remote),
+                }
+
+            active = [
+                (j["started"] + j["runtime_sec"], j["memory_gb"], j["cores"]) for j in self.running.values()
+            ]
+            served = dict(self.served)
+            served.setdefault(session_id, self.service_floor())
+            clock = now
+            position = 0
+            while queued:
+                job = self.order(queued.values(), served, now)[0]
+                del queued[job["session_id"]]
+                served[job["user"]] = served.get(job["user"], 0) + job["runtime_sec"]
+
+                active.sort()
+                while active and (
+                    sum(a[1] for a in active) + job["memory_gb"] > self.memory_gb
+                    or sum(a[2] for a in active) + job["cores"] > self.cores
+                ):
+                    clock = max(clock, active.pop(0)[0])
+                if job["session_id"] == session_id:
+                    return {
+                        **status,
+                        "state": "queued" if session_id in self.queued else "not_submitted",
+                        "position": position,
+                        "estimated_start_sec": round(max(clock - now, 0)),
+                    }
+                active.append((clock + job["runtime_sec"], job["memory_gb"], job["cores"]))
+                position += 1
@@ -1,35 +1,14 @@
+import time
 from pathlib import Path
 import whisper
-
-def format_timestamp(seconds):
-
-    """
-    Converts a time value in seconds (as a float) into a string formatted according to the SubRip Subtitle (SRT) timestamp specification.
-    The SRT timestamp format is 'HH:MM:SS,mmm', where:
-        - HH is hours, zero-padded to two digits
-        - MM is minutes, zero-padded to two digits
-        - SS is seconds, zero-padded to two digits
-        - mmm is milliseconds, zero-padded to three digits
-    Parameters:
-        seconds (float): The time value in seconds to be converted. Can include fractional seconds.
-    Returns:
-        str: The formatted timestamp string in 'HH:MM:SS,mmm' format, suitable for use in SRT subtitle files.
-    Example:
-        >>> format_timestamp(3661.257)
-        '01:01:01,257'
-    """
-
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds - int(seconds)) * 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
-
+from preprocess import broker
+from preprocess.export import read_srt_cues, write_cues
+from preprocess.metadata import load_session_metadata, update_session_metadata, chunk_windows
 
 def translate_chunks_to_srt(session_id: str, model_size: str = "large"):
 
     """
-    Translates all video chunks in uploads/<session_id>/chunks/
+    Translates all video chunks recorded in the session metadata by split_video
     and generates English .srt subtitle files for each chunk.
 
     Args:
@@ -38,33 +17,97 @@ def translate_chunks_to_srt(session_id: str, model_size: str = "large"):
     """
 
     base_dir = Path("uploads") / session_id
-    chunk_dir = base_dir / "chunk"
     srt_dir = base_dir / "srt"
     srt_dir.mkdir(parents=True, exist_ok=True)
 
-    model = whisper.load_model(model_size)
-
-    video_chunks = sorted(chunk_dir.glob("*.mp4"))
+    video_chunks = load_session_metadata(session_id).get("chunks")
     if not video_chunks:
-        raise FileNotFoundError(f"No video chunks found in {chunk_dir}")
+        raise FileNotFoundError(f"No video chunks found for session {session_id}")
+
+    model = whisper.load_model(model_size)
 
-    for chunk_file in video_chunks:
-        print(f"Translating: {chunk_file.name}")
+    written = []
+    for chunk in video_chunks:
+        print(f"Translating: {Path(chunk['path']).name}")
         result = model.transcribe(
-            str(chunk_file),
+            chunk["path"],
             task="translate",  # Translate to English
             language=None,     # Auto-detect
             fp16=False         # Set True if using GPU
         )
 
         # Write to SRT
-        srt_path = srt_dir / f"{chunk_file.stem}.srt"
-        with open(srt_path, "w", encoding="utf-8") as srt_file:
-            for i, segment in enumerate(result["segments"], start=1):
-                srt_file.write(f"{i}\n")
-                srt_file.write(f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n")
-                srt_file.write(segment['text'].strip() + "\n\n")
+        write_cues(result["segments"], srt_dir / f"{chunk['index']}.srt", "srt")
+        written.append(chunk["index"])
+
+    update_session_metadata(session_id, subtitle_chunks=written)
+    print(f"Subtitles saved in: {srt_dir}")
+    return srt_dir
+
+
+def translate_chunks_with_workers(session_id: str, model_size: str = "large", poll_interval: float = 2,
+                                  timeout: float = None, db_path: str = None, chunk_duration: int = 30):
+
+    """
+    Distributed version of translate_chunks_to_srt. Queues one task per chunk on
+    the job broker, waits for worker.py processes to transcribe them and
+    writes their segments to uploads/<session_id>/srt/<n>.srt.
+
+    Tasks are built from the duration in the session metadata, not from the
+    video chunks: workers read each window from the original upload (locally
+    or through the API's /audio endpoint), so they can start before
+    split_video has run. Raises RuntimeError if no worker has been seen for
+    broker.HEARTBEAT_TIMEOUT seconds, so a job never waits forever on an
+    empty worker pool.
 
+    Args:
+        session_id (str): UUID of the session
+        model_size (str): Whisper model size the workers should use
+        poll_interval (float): Seconds between broker status checks
+        timeout (float): Give up after this many seconds (default: no limit
+            while workers are alive)
+        db_path (str): Broker database path or Redis URL (default: SUBTITLE_BROKER)
+        chunk_duration (int): Length of each task's audio window in seconds
+    """
+
+    srt_dir = Path("uploads") / session_id / "srt"
+    srt_dir.mkdir(parents=True, exist_ok=True)
+
+    metadata = load_session_metadata(session_id)
+    windows = chunk_windows(metadata["duration"], chunk_duration)
+    if not windows:
+        raise ValueError(f"Session {session_id} has no audio to transcribe")
+
+    broker.enqueue_session(session_id, metadata["media_path"], windows, model_size, db_path)
+    print(f"Queued {len(windows)} chunks for session: {session_id}")
+
+    written = set()
+    started = time.time()
+    try:
+        while len(written) < len(windows):
+            # Workers also requeue stale tasks, but the coordinator must not
+            # wait forever if every worker has died
+            broker.requeue_stale_tasks(db_path=db_path)
+
+            waited = time.time() - started
+            if waited > broker.HEARTBEAT_TIMEOUT and broker.live_workers(db_path=db_path) == 0:
+                raise RuntimeError(f"No transcription workers seen for {broker.HEARTBEAT_TIMEOUT}s")
+            if timeout is not None and waited > timeout:
+                raise TimeoutError(f"Workers did not finish session {session_id} within {timeout}s")
+
+            for task in broker.session_tasks(session_id, db_path):
+                if task["status"] == "failed":
+                    raise RuntimeError(f"Chunk {task['chunk_index']} failed: {task['error']}")
+                if task["status"] == "done" and task["chunk_index"] not in written:
+                    write_cues(task["segments"], srt_dir / f"{task['chunk_index']}.srt", "srt")
+                    written.add(task["chunk_index"])
+
+            if len(written) < len(windows):
+                time.sleep(poll_interval)
+    finally:
+        broker.clear_session(session_id, db_path)
+
+    update_session_metadata(session_id, subtitle_chunks=sorted(written))
     print(f"Subtitles saved in: {srt_dir}")
     return srt_dir
 
@@ -82,78 +125,51 @@ def merge_srt_chunks(session_id: str, chunk_duration_sec: int = 30, output_filen
 
     srt_dir = Path("uploads") / session_id / "srt"
     output_path = srt_dir / output_filename
-    srt_files = sorted(srt_dir.glob("*.srt"), key=lambda p: int(p.stem))
+    srt_files = sorted((p for p in srt_dir.glob("*.srt") if p.stem.isdigit()), key=lambda p: int(p.stem))
 
     if not srt_files:
         raise FileNotFoundError(f"No SRT files found in {srt_dir}")
 
-    merged_lines = []
-    global_index = 1
-
-    for idx, srt_file in enumerate(srt_files):
-        offset_sec = idx * chunk_duration_sec
-
-        with open(srt_file, "r", encoding="utf-8") as f:
-            block = []
-            for line in f:
-                if line.strip().isdigit():
-                    block = [str(global_index)]  # reset block ID
-                elif "-->" in line:
-                    start, end = [l.strip() for l in line.strip().split("-->")]
-                    start_shifted = shift_timestamp(start, offset_sec)
-                    end_shifted = shift_timestamp(end, offset_sec)
-                    block.append(f"{start_shifted} --> {end_shifted}")
-                elif line.strip() == "":
-                    block.append("")
-                    merged_lines.extend(block)
-                    global_index += 1
-                else:
-                    block.append(line.strip())
-
-    with open(output_path, "w", encoding="utf-8") as out:
-        out.write("\n".join(merged_lines))
+    def shifted_cues():
+        for srt_file in srt_files:
+            offset_sec = (int(srt_file.stem) - 1) * chunk_duration_sec
+            yield from read_srt_cues(srt_file, offset_sec)
+
+    # Cues are streamed straight from the chunk files into the merged file
+    write_cues(shifted_cues(), output_path, "srt")
 
     print(f" Merged SRT saved to: {output_path}")
     return output_path
 
 
-def shift_timestamp(timestamp: str, offset_sec: int) -> str:
+def split_srt_into_chunks(session_id: str, chunk_duration_sec: int = 30, source_filename: str = "full.srt"):
 
     """
-    Shifts a timestamp string by a given offset in seconds.
-
-    The timestamp should be in the SubRip Subtitle (SRT) format: 'HH:MM:SS,mmm'.
-    The function adds the specified offset (in seconds) to the timestamp and returns the new timestamp in the same format.
+    Splits a full-length SRT into per-chunk files (uploads/<session_id>/srt/<n>.srt)
+    with chunk-relative timestamps, the layout the review editor and
+    merge_srt_chunks expect. Each cue goes to the chunk it starts in, so merging
+    the chunk files gives back the same full SRT.
 
     Args:
-        timestamp (str): The original timestamp string (e.g., '00:00:28,000').
-        offset_sec (int): The number of seconds to add to the timestamp.
-
-    Returns:
-        str: The shifted timestamp string in 'HH:MM:SS,mmm' format.
-
-    Example:
-        >>> shift_timestamp('00:00:28,000', 30)
-        '00:00:58,000'
+        session_id (str): UUID of the session
+        chunk_duration_sec (int): Length of each chunk in seconds
+        source_filename (str): Full SRT to split (default: full.srt)
     """
-    
-    hours, minutes, rest = timestamp.split(":")
-    seconds, millis = rest.split(",")
-
-    total_ms = (
-        int(hours) * 3600000 +
-        int(minutes) * 60000 +
-        int(seconds) * 1000 +
-        int(millis)
-    ) + (offset_sec * 1000)
 
-    new_hours = total_ms // 3600000
-    total_ms %= 3600000
-    new_minutes = total_ms // 60000
-    total_ms %= 60000
-    new_seconds = total_ms // 1000
-    new_millis = total_ms % 1000
-
-    return f"{new_hours:02}:{new_minutes:02}:{new_seconds:02},{new_millis:03}"
+    srt_dir = Path("uploads") / session_id / "srt"
+    chunk_count = len(load_session_metadata(session_id).get("chunks") or [])
+
+    chunk_cues = {index: [] for index in range(1, chunk_count + 1)}
+    for cue in read_srt_cues(srt_dir / source_filename):
+        index = int(cue["start"] // chunk_duration_sec) + 1
+        offset_sec = (index - 1) * chunk_duration_sec
+        chunk_cues.setdefault(index, []).append(
+            {"start": cue["start"] - offset_sec, "end": cue["end"] - offset_sec, "text": cue["text"]}
+        )
 
+    for index, cues in chunk_cues.items():
+        write_cues(cues, srt_dir / f"{index}.srt", "srt")
+    update_session_metadata(session_id, subtitle_chunks=sorted(chunk_cues))
 
+    print(f" Split {source_filename} into {len(chunk_cues)} chunk files in: {srt_dir}")
+    return srt_dir
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The project is run from its root directory (uvicorn main:app), not installed
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
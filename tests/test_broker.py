@@ -0,0 +1,196 @@
+import json
+import time
+
+import pytest
+
+from preprocess import broker, redis_broker
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def db(request, tmp_path, monkeypatch):
+    # Every broker test runs against both backends
+    if request.param == "sqlite":
+        return str(tmp_path / "broker.db")
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setitem(redis_broker.clients, "redis://broker", fakeredis.FakeRedis(decode_responses=True))
+    return "redis://broker"
+
+
+def queue_session(db, session_id="s", count=2):
+    windows = [(i, (i - 1) * 30, 30) for i in range(1, count + 1)]
+    return broker.enqueue_session(session_id, "/media/film.mp4", windows, "tiny", db)
+
+
+def test_enqueue_replaces_previous_run(db):
+    assert queue_session(db, count=3) == 3
+    assert queue_session(db, count=2) == 2
+    tasks = broker.session_tasks("s", db)
+    assert [t["chunk_index"] for t in tasks] == [1, 2]
+    assert all(t["status"] == "pending" and t["segments"] is None for t in tasks)
+
+
+def test_claim_takes_oldest_pending_task_once(db):
+    queue_session(db)
+    first = broker.claim_task("w1", db)
+    second = broker.claim_task("w2", db)
+    assert (first["chunk_index"], first["worker_id"], first["attempts"]) == (1, "w1", 1)
+    assert second["chunk_index"] == 2
+    assert broker.claim_task("w3", db) is None
+
+
+def test_complete_stores_segments(db):
+    queue_session(db, count=1)
+    task = broker.claim_task("w1", db)
+    segments = [{"start": 0.0, "end": 1.5, "text": "hi"}]
+    assert broker.complete_task(task["id"], "w1", segments, db)
+    [done] = broker.session_tasks("s", db)
+    assert done["status"] == "done"
+    assert done["segments"] == segments
+
+
+def test_stale_task_is_reassigned_and_old_result_discarded(db):
+    queue_session(db, count=1)
+    task = broker.claim_task("w1", db)
+
+    assert broker.requeue_stale_tasks(timeout=-1, db_path=db) == 1
+    retry = broker.claim_task("w2", db)
+    assert retry["id"] == task["id"] and retry["attempts"] == 2
+
+    # The first worker comes back: its heartbeat and result are refused
+    assert not broker.heartbeat(task["id"], "w1", db)
+    assert not broker.complete_task(task["id"], "w1", [], db)
+    assert broker.heartbeat(task["id"], "w2", db)
+    assert broker.complete_task(task["id"], "w2", [{"start": 0, "end": 1, "text": "b"}], db)
+    assert broker.session_tasks("s", db)[0]["segments"][0]["text"] == "b"
+
+
+def test_fresh_heartbeat_is_not_requeued(db):
+    queue_session(db, count=1)
+    broker.claim_task("w1", db)
+    assert broker.requeue_stale_tasks(timeout=60, db_path=db) == 0
+
+
+def test_failed_task_retries_until_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(broker, "MAX_ATTEMPTS", 2)
+    queue_session(db, count=1)
+
+    task = broker.claim_task("w1", db)
+    broker.fail_task(task["id"], "w1", "boom", db)
+    [retry] = broker.session_tasks("s", db)
+    assert retry["status"] == "pending" and retry["error"] == "boom"
+
+    task = broker.claim_task("w2", db)
+    broker.fail_task(task["id"], "w2", "boom again", db)
+    [failed] = broker.session_tasks("s", db)
+    assert failed["status"] == "failed"
+    assert broker.claim_task("w3", db) is None
+
+
+def test_stale_task_fails_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(broker, "MAX_ATTEMPTS", 1)
+    queue_session(db, count=1)
+    broker.claim_task("w1", db)
+    broker.requeue_stale_tasks(timeout=-1, db_path=db)
+    [task] = broker.session_tasks("s", db)
+    assert task["status"] == "failed" and task["error"] == "worker heartbeat lost"
+
+
+def test_live_workers(db):
+    assert broker.live_workers(db_path=db) == 0
+    broker.register_worker("w1", db)
+    broker.register_worker("w1", db)
+    assert broker.live_workers(db_path=db) == 1
+    assert broker.live_workers(timeout=-1, db_path=db) == 0
+
+    queue_session(db, count=1)
+    task = broker.claim_task("w2", db)
+    broker.heartbeat(task["id"], "w2", db)
+    assert broker.live_workers(db_path=db) == 2
+
+
+def test_clear_session_leaves_other_sessions(db):
+    queue_session(db, "a")
+    queue_session(db, "b")
+    broker.clear_session("a", db)
+    assert broker.session_tasks("a", db) == []
+    assert len(broker.session_tasks("b", db)) == 2
+
+
+def test_redis_url_selects_backend(monkeypatch):
+    monkeypatch.setattr(broker, "BROKER_PATH", "redis://queue-host:6379/0")
+    assert broker.redis_url() == "redis://queue-host:6379/0"
+    assert broker.redis_url("/var/lib/subtitle/broker.db") is None
+    monkeypatch.setattr(broker, "BROKER_PATH", "/var/lib/subtitle/broker.db")
+    assert broker.redis_url() is None
+
+
+def test_cleared_session_is_not_claimed(db):
+    queue_session(db, "a", count=1)
+    queue_session(db, "b", count=1)
+    broker.clear_session("a", db)
+    task = broker.claim_task("w1", db)
+    assert task["session_id"] == "b"
+    assert broker.claim_task("w1", db) is None
+
+
+def test_connect_requires_a_broker(monkeypatch):
+    monkeypatch.setattr(broker, "BROKER_PATH", None)
+    with pytest.raises(RuntimeError):
+        broker.session_tasks("s")
+
+
+def test_coordinator_gives_up_without_workers(tmp_path, monkeypatch, db):
+    pytest.importorskip("whisper")
+    from preprocess.subtitle import translate_chunks_with_workers
+
+    monkeypatch.chdir(tmp_path)
+    session_dir = tmp_path / "uploads" / "s"
+    session_dir.mkdir(parents=True)
+    (session_dir / "metadata.json").write_text(json.dumps({
+        "media_path": "/media/film.mp4",
+        "duration": 60,
+        "chunks": [{"index": 1, "start": 0, "duration": 30}, {"index": 2, "start": 30, "duration": 30}],
+    }))
+    monkeypatch.setattr(broker, "HEARTBEAT_TIMEOUT", 0.05)
+
+    started = time.time()
+    with pytest.raises(RuntimeError, match="No transcription workers"):
+        translate_chunks_with_workers("s", "tiny", poll_interval=0.01, db_path=db)
+    assert time.time() - started < 5
+    # Tasks are cleaned up so the job does not linger in the broker
+    assert broker.session_tasks("s", db) == []
+
+
+def test_coordinator_writes_worker_results(tmp_path, monkeypatch, db):
+    pytest.importorskip("whisper")
+    from preprocess.subtitle import translate_chunks_with_workers
+
+    monkeypatch.chdir(tmp_path)
+    session_dir = tmp_path / "uploads" / "s"
+    session_dir.mkdir(parents=True)
+    # No video chunks yet: tasks are built from the duration, before split_video
+    (session_dir / "metadata.json").write_text(json.dumps({
+        "media_path": "/media/film.mp4",
+        "duration": 40,
+        "chunks": [],
+    }))
+
+    # Stand-in worker: answer every task as soon as the coordinator polls
+    real_session_tasks = broker.session_tasks
+
+    def answering_session_tasks(session_id, db_path=None):
+        broker.register_worker("w1", db_path)
+        while True:
+            task = broker.claim_task("w1", db_path)
+            if task is None:
+                break
+            text = f"chunk {task['chunk_index']} at {task['start_sec']:g}s for {task['duration_sec']:g}s"
+            broker.complete_task(task["id"], "w1", [{"start": 1.0, "end": 2.0, "text": text}], db_path)
+        return real_session_tasks(session_id, db_path)
+
+    monkeypatch.setattr(broker, "session_tasks", answering_session_tasks)
+    translate_chunks_with_workers("s", "tiny", poll_interval=0.01, db_path=db)
+
+    srt_dir = session_dir / "srt"
+    assert "chunk 2 at 30s for 10s" in (srt_dir / "2.srt").read_text(encoding="utf-8")
+    assert json.loads((session_dir / "metadata.json").read_text())["subtitle_chunks"] == [1, 2]
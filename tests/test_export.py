@@ -0,0 +1,175 @@
+import json
+import os
+import time
+
+import pytest
+
+from preprocess.export import (
+    export_hls_subtitles,
+    export_subtitles,
+    format_ass_time,
+    format_srt_time,
+    format_vtt_time,
+    negotiate_format,
+    read_srt_cues,
+    write_cues,
+)
+
+CUES = [
+    {"start": 1.0, "end": 12.5, "text": "Hello\nworld"},
+    {"start": 20.0, "end": 21.25, "text": " Bye "},
+]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    srt_dir = tmp_path / "uploads" / "s" / "srt"
+    srt_dir.mkdir(parents=True)
+    write_cues(CUES, srt_dir / "full.srt", "srt")
+    return srt_dir / "full.srt"
+
+
+def test_time_formats():
+    assert format_srt_time(3661.257) == "01:01:01,257"
+    assert format_vtt_time(3661.257) == "01:01:01.257"
+    assert format_ass_time(3661.257) == "1:01:01.25"
+    # Rounds instead of truncating float noise, and never goes negative
+    assert format_srt_time(0.1 + 0.2) == "00:00:00,300"
+    assert format_srt_time(-1) == "00:00:00,000"
+
+
+def test_srt_round_trip(tmp_path):
+    path = write_cues(CUES, tmp_path / "a.srt", "srt")
+    assert path.read_text(encoding="utf-8") == (
+        "1\n00:00:01,000 --> 00:00:12,500\nHello\nworld\n\n"
+        "2\n00:00:20,000 --> 00:00:21,250\nBye\n\n"
+    )
+    cues = list(read_srt_cues(path, offset_sec=30))
+    assert cues == [
+        {"start": 31.0, "end": 42.5, "text": "Hello\nworld"},
+        {"start": 50.0, "end": 51.25, "text": "Bye"},
+    ]
+
+
+def test_read_srt_tolerates_missing_trailing_blank_line(tmp_path):
+    path = tmp_path / "a.srt"
+    path.write_text("1\n00:00:01,000 --> 00:00:02,000\nOne\n\n\n2\n00:00:03,000 --> 00:00:04,000\nTwo", encoding="utf-8")
+    assert [c["text"] for c in read_srt_cues(path)] == ["One", "Two"]
+
+
+def test_vtt_ass_json_writers(tmp_path):
+    vtt = write_cues(CUES, tmp_path / "a.vtt", "vtt").read_text(encoding="utf-8")
+    assert vtt.startswith("WEBVTT\n\n00:00:01.000 --> 00:00:12.500\nHello\nworld\n\n")
+
+    ass = write_cues(CUES, tmp_path / "a.ass", "ass").read_text(encoding="utf-8")
+    assert "Dialogue: 0,0:00:01.00,0:00:12.50,Default,,0,0,0,,Hello\\Nworld\n" in ass
+    assert "[Events]" in ass
+
+    data = json.loads(write_cues(CUES, tmp_path / "a.json", "json").read_text(encoding="utf-8"))
+    assert data == [
+        {"index": 1, "start": 1.0, "end": 12.5, "text": "Hello\nworld"},
+        {"index": 2, "start": 20.0, "end": 21.25, "text": "Bye"},
+    ]
+
+    assert json.loads(write_cues([], tmp_path / "empty.json", "json").read_text(encoding="utf-8")) == []
+
+
+def test_write_cues_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        write_cues(CUES, tmp_path / "a.txt", "txt")
+
+
+def test_export_is_cached_until_source_changes(session):
+    path = export_subtitles("s", "vtt")
+    assert path.name == "full.vtt"
+    first_mtime = path.stat().st_mtime
+
+    assert export_subtitles("s", "vtt").stat().st_mtime == first_mtime
+
+    write_cues(CUES[:1], session, "srt")
+    future = time.time() + 10
+    os.utime(session, (future, future))
+    assert "Bye" not in export_subtitles("s", "vtt").read_text(encoding="utf-8")
+
+    assert export_subtitles("s", "srt").resolve() == session
+
+
+def test_failed_export_leaves_no_partial_file(session):
+    future = time.time() + 10
+    session.write_text("1\n00:00:01,000 --> 00:00:02,000\nok\n\n2\n00:00:0x,000 --> 00:00:04,000\nbad\n",
+                       encoding="utf-8")
+    os.utime(session, (future, future))
+
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Invalid SRT timing line"):
+            export_subtitles("s", "json")
+    export_dir = session.parent.parent / "export"
+    assert list(export_dir.iterdir()) == []
+
+
+def test_export_missing_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        export_subtitles("missing", "vtt")
+
+
+def test_hls_segments(session):
+    playlist = export_hls_subtitles("s", segment_duration=10, mpegts_offset=126000)
+    lines = playlist.read_text(encoding="utf-8").splitlines()
+    assert lines[0] == "#EXTM3U"
+    assert "#EXT-X-TARGETDURATION:10" in lines
+    assert [l for l in lines if l.endswith(".vtt")] == ["0.vtt", "1.vtt", "2.vtt"]
+    assert lines[-1] == "#EXT-X-ENDLIST"
+
+    hls_dir = playlist.parent
+    first = (hls_dir / "0.vtt").read_text(encoding="utf-8")
+    assert first.startswith("WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:126000,LOCAL:00:00:00.000\n")
+    # A cue spanning a segment boundary is repeated in each segment it overlaps
+    assert "Hello" in first and "Hello" in (hls_dir / "1.vtt").read_text(encoding="utf-8")
+    assert "Bye" in (hls_dir / "2.vtt").read_text(encoding="utf-8")
+    assert "Bye" not in (hls_dir / "1.vtt").read_text(encoding="utf-8")
+
+
+def test_hls_rebuild_replaces_the_whole_directory(session):
+    playlist = export_hls_subtitles("s", segment_duration=10)
+    write_cues(CUES[:1], session, "srt")
+    future = time.time() + 10
+    os.utime(session, (future, future))
+
+    playlist = export_hls_subtitles("s", segment_duration=10)
+    assert sorted(p.name for p in playlist.parent.iterdir()) == ["0.vtt", "1.vtt", "index.m3u8"]
+    # Nothing is left behind from the build or the old directory
+    assert [p.name for p in playlist.parent.parent.iterdir()] == ["hls"]
+
+
+def test_failed_hls_rebuild_keeps_the_previous_segments(session):
+    playlist = export_hls_subtitles("s", segment_duration=10)
+    before = playlist.read_text(encoding="utf-8")
+    session.write_text("1\n00:00:01,000 --> nonsense\nbad\n", encoding="utf-8")
+    future = time.time() + 10
+    os.utime(session, (future, future))
+
+    with pytest.raises(ValueError):
+        export_hls_subtitles("s", segment_duration=10)
+    assert playlist.read_text(encoding="utf-8") == before
+    assert (playlist.parent / "2.vtt").exists()
+
+
+@pytest.mark.parametrize("fmt, accept, expected", [
+    ("VTT", None, "vtt"),
+    (".json", "text/vtt", "json"),
+    (None, None, "srt"),
+    (None, "text/html", "srt"),
+    (None, "text/html, text/vtt;q=0.9, application/json;q=0.5", "vtt"),
+    (None, "text/vtt;q=0.2, application/json", "json"),
+    (None, "application/json;q=0, text/x-ssa;q=0.1", "ass"),
+    (None, "text/vtt;q=bogus, application/json;q=0.3", "json"),
+])
+def test_negotiate_format(fmt, accept, expected):
+    assert negotiate_format(fmt, accept) == expected
+
+
+def test_negotiate_format_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        negotiate_format("docx")
@@ -0,0 +1,174 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("whisper")
+pytest.importorskip("pydub")
+
+from preprocess import full_movie_sub
+from preprocess.export import read_srt_cues, write_cues
+from preprocess.subtitle import merge_srt_chunks, split_srt_into_chunks
+
+SR = full_movie_sub.SAMPLE_RATE
+
+
+def fake_stream(total_sec):
+    """
+    Stands in for stream_audio. Each sample holds its own global time in
+    seconds, so the stub model can tell where in the film a window starts.
+    """
+
+    def stream(media_path, block_sec, sample_rate):
+        total = int(total_sec * sample_rate)
+        block = int(block_sec * sample_rate)
+        for start in range(0, total, block):
+            yield np.arange(start, min(start + block, total), dtype=np.float64) / sample_rate
+
+    return stream
+
+
+class ScriptModel:
+    """
+    Stub Whisper model that "hears" a fixed script of utterances given in
+    global time. Like Whisper, it reports utterances cut off by the end of the
+    window with their end clipped to the window, and window-relative times.
+    An utterance may carry a fourth element, its no-speech probability.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = []
+
+    def transcribe(self, audio, **kwargs):
+        window_start = float(audio[0])
+        window_end = window_start + len(audio) / SR
+        self.calls.append({"start": window_start, "end": window_end, **kwargs})
+        segments = [
+            {
+                "start": start - window_start,
+                "end": min(end, window_end) - window_start,
+                "text": f" {text} ",
+                "no_speech_prob": no_speech[0] if no_speech else 0.0,
+            }
+            for start, end, text, *no_speech in self.script
+            if start >= window_start and start < window_end
+        ]
+        return {"segments": segments, "language": "fr"}
+
+
+def run(monkeypatch, script, total_sec, **kwargs):
+    monkeypatch.setattr(full_movie_sub, "stream_audio", fake_stream(total_sec))
+    model = ScriptModel(script)
+    cues = list(full_movie_sub.stream_long_form_cues(model, "film.mp4", **kwargs))
+    return cues, model
+
+
+def test_every_utterance_is_emitted_once_with_global_times(monkeypatch):
+    # Utterances every 7s for 12 minutes; several straddle window boundaries
+    script = [(t, t + 6, f"line {t}") for t in range(0, 720, 7)]
+    cues, model = run(monkeypatch, script, 725, window_sec=60, margin_sec=5)
+
+    assert [(c["start"], c["end"], c["text"]) for c in cues] == [
+        (pytest.approx(start), pytest.approx(end), text) for start, end, text in script
+    ]
+    assert len(model.calls) > 10
+
+
+def test_next_window_starts_at_last_committed_segment(monkeypatch):
+    script = [(0, 20, "a"), (20, 38, "b"), (38, 52, "c"), (52, 70, "d")]
+    cues, model = run(monkeypatch, script, 80, window_sec=60, margin_sec=5)
+
+    # "d" is cut by the first window (ends at 60 > 55), so the second window
+    # starts where "c" ended and transcribes "d" in full
+    assert model.calls[0]["start"] == 0 and model.calls[0]["end"] == pytest.approx(60)
+    assert model.calls[1]["start"] == pytest.approx(52)
+    assert cues[-1] == {"start": pytest.approx(52), "end": pytest.approx(70), "text": "d"}
+
+
+def test_silent_window_still_makes_progress(monkeypatch):
+    script = [(150, 155, "after the silence")]
+    cues, model = run(monkeypatch, script, 200, window_sec=60, margin_sec=5)
+
+    assert [c["text"] for c in cues] == ["after the silence"]
+    assert cues[0]["start"] == pytest.approx(150)
+    # A silent window is dropped up to its margin, which the next window re-reads
+    silent = [c for c in model.calls if c["end"] <= 150]
+    assert silent
+    for previous, current in zip(silent, model.calls[1:]):
+        assert current["start"] == pytest.approx(previous["end"] - 5)
+
+
+def test_overlong_segment_does_not_stall(monkeypatch):
+    script = [(0, 90, "monologue"), (95, 99, "end")]
+    cues, _ = run(monkeypatch, script, 100, window_sec=60, margin_sec=5)
+    assert [c["text"] for c in cues] == ["monologue", "end"]
+    assert cues[1]["start"] == pytest.approx(95)
+
+
+def test_final_window_keeps_segments_up_to_the_end(monkeypatch):
+    script = [(0, 10, "first"), (85, 90, "last words")]
+    cues, model = run(monkeypatch, script, 90, window_sec=60, margin_sec=5)
+    assert cues[-1] == {"start": pytest.approx(85), "end": pytest.approx(90), "text": "last words"}
+    assert model.calls[-1]["end"] == pytest.approx(90)
+
+
+def test_context_and_language_carry_over(monkeypatch):
+    script = [(0, 10, "Ridley"), (20, 30, "Scott"), (70, 80, "again")]
+    _, model = run(monkeypatch, script, 100, window_sec=60, margin_sec=5, prompt_chars=10)
+
+    assert model.calls[0]["initial_prompt"] is None
+    assert model.calls[0]["language"] is None
+    assert model.calls[1]["initial_prompt"] == "Ridley Scott"[-10:]
+    assert model.calls[1]["language"] == "fr"
+    assert all(c["task"] == "translate" and c["condition_on_previous_text"] for c in model.calls)
+
+
+def test_language_is_not_locked_on_music_or_silence(monkeypatch):
+    script = [(0, 20, "♪", 0.9), (70, 80, "Bonjour"), (130, 140, "encore")]
+    cues, model = run(monkeypatch, script, 200, window_sec=60, margin_sec=5)
+
+    assert [c["text"] for c in cues] == ["♪", "Bonjour", "encore"]
+    # Window 1 only had music and window 2 is the first with speech
+    assert [c["language"] for c in model.calls[:3]] == [None, None, "fr"]
+    assert all(c["language"] == "fr" for c in model.calls[2:])
+
+
+def test_given_language_is_kept(monkeypatch):
+    _, model = run(monkeypatch, [(70, 80, "Hallo")], 200, window_sec=60, margin_sec=5, language="de")
+    assert {c["language"] for c in model.calls} == {"de"}
+
+
+def test_empty_audio(monkeypatch):
+    cues, model = run(monkeypatch, [], 0)
+    assert cues == [] and model.calls == []
+
+
+def test_split_then_merge_reproduces_full_srt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    session_dir = tmp_path / "uploads" / "s"
+    srt_dir = session_dir / "srt"
+    srt_dir.mkdir(parents=True)
+    (session_dir / "metadata.json").write_text(json.dumps({
+        "media_path": "film.mp4",
+        "duration": 95,
+        "chunks": [{"index": i} for i in range(1, 5)],
+    }))
+    cues = [
+        {"start": 1.0, "end": 4.5, "text": "one"},
+        {"start": 28.0, "end": 33.25, "text": "spans\nchunks"},   # crosses the 30s boundary
+        {"start": 61.5, "end": 62.0, "text": "three"},
+    ]
+    write_cues(cues, srt_dir / "full.srt", "srt")
+    original = (srt_dir / "full.srt").read_text(encoding="utf-8")
+
+    split_srt_into_chunks("s")
+    assert [c["text"] for c in read_srt_cues(srt_dir / "2.srt")] == []
+    assert list(read_srt_cues(srt_dir / "1.srt"))[1]["end"] == pytest.approx(33.25)
+    assert list(read_srt_cues(srt_dir / "3.srt"))[0]["start"] == pytest.approx(1.5)
+    # Chunks with no cues still get a file, so every chunk can be edited
+    assert (srt_dir / "4.srt").exists()
+    assert json.loads((session_dir / "metadata.json").read_text())["subtitle_chunks"] == [1, 2, 3, 4]
+
+    merge_srt_chunks("s")
+    assert (srt_dir / "full.srt").read_text(encoding="utf-8") == original
@@ -0,0 +1,111 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from preprocess import metadata as metadata_module
+from preprocess.metadata import (
+    chunk_windows,
+    load_session_metadata,
+    nearest_keyframe,
+    probe_media,
+    save_session_metadata,
+)
+
+FORMAT = {
+    "format_name": "matroska,webm",
+    "duration": "95.5",
+    "size": "1000",
+    "start_time": "1.400000",
+}
+STREAMS = [
+    {"index": 0, "codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080,
+     "avg_frame_rate": "24000/1001"},
+    {"index": 1, "codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2},
+]
+# ffprobe packet times are absolute, so they include the container's start_time
+PACKETS = "1.400000,K__\n1.441708,___\n11.400000,K__\n21.400000,K_\nN/A,K__\n"
+
+
+@pytest.fixture
+def fake_ffprobe(monkeypatch):
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        if "-show_format" in cmd:
+            return SimpleNamespace(stdout=json.dumps({"format": FORMAT, "streams": STREAMS}).encode())
+        return SimpleNamespace(stdout=PACKETS.encode())
+
+    monkeypatch.setattr(metadata_module.subprocess, "run", run)
+    return calls
+
+
+@pytest.fixture
+def session_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "uploads" / "s"
+    path.mkdir(parents=True)
+    return path
+
+
+def test_probe_media(fake_ffprobe):
+    info = probe_media("/media/film.mkv")
+    assert info["duration"] == 95.5 and info["start_time"] == 1.4
+    assert info["video"]["frame_rate"] == pytest.approx(23.976, abs=1e-3)
+    assert (info["audio"]["sample_rate"], info["audio"]["channels"]) == (48000, 2)
+    # Keyframes are measured from the start of the file, like ffmpeg's -ss
+    assert info["keyframes"] == pytest.approx([0.0, 10.0, 20.0])
+
+
+def test_nearest_keyframe():
+    record = {"keyframes": [0.0, 10.0, 20.0]}
+    assert nearest_keyframe(record, 9.99) == 0.0
+    assert nearest_keyframe(record, 10.0) == 10.0
+    assert nearest_keyframe(record, 95) == 20.0
+    assert nearest_keyframe({"keyframes": []}, 30) == 0.0
+
+
+def test_chunk_windows():
+    assert chunk_windows(65.5) == [(1, 0, 30), (2, 30, 30), (3, 60, 5.5)]
+    assert chunk_windows(0) == []
+
+
+def test_old_records_get_relative_keyframes(session_dir, fake_ffprobe):
+    (session_dir / "metadata.json").write_text(json.dumps({
+        "media_path": "/media/film.mkv",
+        "duration": 95.5,
+        "keyframes": [1.4, 11.4, 21.4],
+        "chunks": [{"index": 1}],
+    }))
+    record = load_session_metadata("s")
+    assert record["keyframes"] == pytest.approx([0.0, 10.0, 20.0])
+    assert record["chunks"] == [{"index": 1}]
+    assert json.loads((session_dir / "metadata.json").read_text())["start_time"] == 1.4
+
+    # Fixed once: later loads do not probe again
+    fake_ffprobe.clear()
+    load_session_metadata("s")
+    assert fake_ffprobe == []
+
+
+def test_concurrent_saves_do_not_collide(session_dir):
+    errors = []
+
+    def save(n):
+        try:
+            for i in range(50):
+                save_session_metadata("s", {"writer": n, "i": i})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert json.loads((session_dir / "metadata.json").read_text())["i"] == 49
+    assert [p.name for p in session_dir.iterdir()] == ["metadata.json"]
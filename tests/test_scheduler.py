@@ -0,0 +1,198 @@
+import time
+
+import pytest
+
+from preprocess import scheduler as scheduler_module
+from preprocess.scheduler import (
+    MODEL_MEMORY_GB,
+    MODEL_REALTIME_FACTOR,
+    SPLIT_MEMORY_GB,
+    SPLIT_REALTIME_FACTOR,
+    SPLIT_THREADS,
+    JobScheduler,
+    QueueFull,
+    estimate_job_cost,
+)
+
+FILM = 3 * 3600
+TRAILER = 120
+
+
+@pytest.fixture(autouse=True)
+def many_cores(monkeypatch):
+    # Keep core estimates independent of the machine running the tests
+    monkeypatch.setattr(scheduler_module.os, "cpu_count", lambda: 16)
+
+
+def make_scheduler(**kwargs):
+    kwargs.setdefault("memory_gb", 12)
+    kwargs.setdefault("cores", 16)
+    return JobScheduler(**kwargs)
+
+
+def test_estimate_job_cost():
+    large = estimate_job_cost(100, "large")
+    assert large["memory_gb"] == MODEL_MEMORY_GB["large"]
+    # The split runs before transcription on the same host
+    assert large["runtime_sec"] == pytest.approx(100 * (SPLIT_REALTIME_FACTOR + MODEL_REALTIME_FACTOR["large"]))
+    assert estimate_job_cost(100, "large-v3") == large
+    assert estimate_job_cost(100, "unknown") == large
+    assert estimate_job_cost(100, "tiny")["memory_gb"] < large["memory_gb"]
+
+    remote = estimate_job_cost(100, "large", remote=True)
+    assert (remote["memory_gb"], remote["cores"]) == (SPLIT_MEMORY_GB, SPLIT_THREADS)
+    assert remote["runtime_sec"] == pytest.approx(100 * MODEL_REALTIME_FACTOR["large"])
+
+
+def test_job_is_always_admitted_on_an_idle_host():
+    s = make_scheduler(memory_gb=1)
+    s.submit("film", "a", FILM, "large")
+    assert s.try_acquire("film")
+
+
+def test_job_waits_until_it_fits():
+    s = make_scheduler()
+    s.submit("film", "a", FILM, "large")
+    assert s.try_acquire("film")
+
+    s.submit("film2", "b", FILM, "large")
+    assert not s.try_acquire("film2")
+
+    s.release("film")
+    assert s.try_acquire("film2")
+
+
+def test_remote_jobs_share_the_coordinator():
+    s = make_scheduler()
+    for i in range(5):
+        s.submit(f"job{i}", f"user{i}", FILM, "large", remote=True)
+        assert s.try_acquire(f"job{i}")
+    assert s.status()["running"] == 5
+
+
+def test_remote_jobs_are_limited_by_split_cores():
+    # Each remote job still re-encodes its video here, with SPLIT_THREADS threads
+    s = make_scheduler(cores=2 * SPLIT_THREADS)
+    for i in range(3):
+        s.submit(f"job{i}", f"user{i}", FILM, "large", remote=True)
+    assert s.try_acquire("job0") and s.try_acquire("job1")
+    assert not s.try_acquire("job2")
+
+
+def test_only_the_head_of_the_queue_is_admitted():
+    s = make_scheduler()
+    s.submit("film", "a", FILM, "large")
+    s.try_acquire("film")
+    s.submit("second", "b", FILM, "large")
+    s.submit("small", "c", TRAILER, "tiny")
+    # "small" fits next to the running film and is first in line
+    assert not s.try_acquire("second")
+    assert s.try_acquire("small")
+
+
+def test_priority_comes_first():
+    s = make_scheduler()
+    s.submit("low", "a", TRAILER, "large")
+    s.submit("high", "b", FILM, "large", priority=5)
+    assert s.next_job()["session_id"] == "high"
+
+
+def test_short_job_is_not_stuck_behind_a_film():
+    s = make_scheduler()
+    s.submit("film", "a", FILM, "large")
+    s.submit("trailer", "b", TRAILER, "large")
+    assert s.next_job()["session_id"] == "trailer"
+
+
+def test_users_share_fairly():
+    s = make_scheduler()
+    for name in ("a1", "a2", "a3"):
+        s.submit(name, "a", TRAILER, "large")
+    assert s.try_acquire("a1")
+    s.submit("b1", "b", TRAILER, "large")
+
+    order = []
+    running = "a1"
+    while s.queued:
+        s.release(running)
+        running = s.next_job()["session_id"]
+        assert s.try_acquire(running)
+        order.append(running)
+    # b joins at a's level of service, then the two users alternate
+    # instead of b waiting behind a's whole backlog
+    assert order == ["a2", "b1", "a3"]
+
+
+def test_returning_user_gets_no_banked_credit_or_penalty():
+    s = make_scheduler()
+    s.submit("a1", "a", FILM, "large")
+    s.try_acquire("a1")
+    s.release("a1")
+    s.submit("b1", "b", TRAILER, "large")
+    s.try_acquire("b1")
+    # a's earlier film does not count against them once they were idle
+    s.submit("a2", "a", TRAILER, "large")
+    assert s.served["a"] == s.served["b"]
+
+
+def test_waiting_long_job_ages_ahead(monkeypatch):
+    s = make_scheduler()
+    s.submit("film", "a", FILM, "large")
+    s.submit("trailer", "a", TRAILER, "large")
+    assert s.next_job()["session_id"] == "trailer"
+
+    s.queued["film"]["submitted"] -= 2 * (FILM - TRAILER) * MODEL_REALTIME_FACTOR["large"] / scheduler_module.AGING_FACTOR
+    assert s.next_job()["session_id"] == "film"
+
+
+def test_queue_limit_and_duplicates():
+    s = make_scheduler(max_queued=1)
+    s.submit("a", "u", TRAILER, "large")
+    with pytest.raises(ValueError):
+        s.submit("a", "u", TRAILER, "large")
+    with pytest.raises(QueueFull):
+        s.submit("b", "u", TRAILER, "large")
+    s.release("a")
+    s.submit("b", "u", TRAILER, "large")
+
+
+def test_status_estimates_start_times():
+    s = make_scheduler()
+    s.submit("film", "a", FILM, "large")
+    s.try_acquire("film")
+    s.submit("film2", "a", FILM, "large")
+    s.submit("trailer", "b", TRAILER, "large")
+
+    film_runtime = estimate_job_cost(FILM, "large")["runtime_sec"]
+    trailer_runtime = estimate_job_cost(TRAILER, "large")["runtime_sec"]
+
+    assert s.status("film")["state"] == "running"
+    trailer = s.status("trailer")
+    assert (trailer["state"], trailer["position"]) == ("queued", 0)
+    assert trailer["estimated_start_sec"] == pytest.approx(film_runtime, abs=2)
+    film2 = s.status("film2")
+    assert film2["position"] == 1
+    assert film2["estimated_start_sec"] == pytest.approx(film_runtime + trailer_runtime, abs=2)
+    assert trailer["queue_depth"] == 2 and trailer["running"] == 1
+
+
+def test_status_for_unsubmitted_sessions():
+    s = make_scheduler()
+    s.submit("film", "a", FILM, "large")
+    s.try_acquire("film")
+
+    assert s.status("new")["state"] == "unknown"
+    small = s.status("new", TRAILER, "tiny")
+    assert (small["state"], small["estimated_start_sec"]) == ("not_submitted", 0)
+    big = s.status("new", TRAILER, "large")
+    assert big["estimated_start_sec"] == pytest.approx(estimate_job_cost(FILM, "large")["runtime_sec"], abs=2)
+    assert "new" not in s.queued
+
+
+def test_status_counts_overrunning_jobs_as_finishing_now():
+    s = make_scheduler()
+    s.submit("film", "a", FILM, "large")
+    s.try_acquire("film")
+    s.running["film"]["started"] = time.time() - 10 * FILM
+    s.submit("next", "b", FILM, "large")
+    assert s.status("next")["estimated_start_sec"] == 0
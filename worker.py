@@ -0,0 +1,146 @@
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+import urllib.parse
+import urllib.request
+import whisper
+from preprocess import broker
+from preprocess.functions import load_audio_window, pcm_to_float
+
+# Seconds between heartbeats while a task is being transcribed
+HEARTBEAT_INTERVAL = 10
+
+# Base URL of the API (e.g. http://api-host:8000). When set, audio windows are
+# fetched from its /audio endpoint, so workers on other machines never need
+# access to the upload directory. When unset, the task's media path is read
+# from the local disk.
+API_URL = os.environ.get("SUBTITLE_API_URL")
+
+# Seconds to wait for the API to decode and send one audio window
+AUDIO_REQUEST_TIMEOUT = 120
+
+
+def keep_alive(task_id: int, worker_id: str, stop: threading.Event, db_path: str = None):
+
+    """
+    Sends heartbeats for a running task until `stop` is set, so the broker
+    does not hand the task to another worker while it is still in progress.
+    """
+
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        if not broker.heartbeat(task_id, worker_id, db_path):
+            print(f" Task {task_id} was reassigned, its result will be discarded")
+            return
+
+
+def fetch_audio_window(api_url: str, task: dict):
+
+    """
+    Downloads a task's audio window from the API's /audio endpoint.
+
+    Returns:
+        numpy.ndarray: Mono float32 samples in [-1, 1].
+    """
+
+    query = urllib.parse.urlencode({"start": task["start_sec"], "duration": task["duration_sec"]})
+    url = f"{api_url.rstrip('/')}/audio/{urllib.parse.quote(task['session_id'])}?{query}"
+    with urllib.request.urlopen(url, timeout=AUDIO_REQUEST_TIMEOUT) as response:
+        return pcm_to_float(response.read())
+
+
+def run_task(model, task: dict, api_url: str = None):
+
+    """
+    Transcribes one audio window and returns its segments.
+
+    Args:
+        model: Loaded Whisper model.
+        task (dict): Task claimed from the broker.
+        api_url (str): Fetch the audio from this API instead of the task's local media path.
+
+    Returns:
+        list[dict]: Segments with "start", "end" and "text", relative to the window start.
+    """
+
+    if api_url:
+        audio = fetch_audio_window(api_url, task)
+    else:
+        audio = load_audio_window(task["media_path"], task["start_sec"], task["duration_sec"])
+    result = model.transcribe(
+        audio,
+        task="translate",  # Translate to English
+        language=None,     # Auto-detect
+        fp16=False         # Set True if using GPU
+    )
+    return [
+        {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+        for segment in result["segments"]
+    ]
+
+
+def run_worker(worker_id: str = None, db_path: str = None, poll_interval: float = 2, once: bool = False,
+               api_url: str = None):
+
+    """
+    Pulls chunk tasks from the job broker until stopped.
+
+    The worker keeps no state of its own: audio windows are fetched from the
+    API (or read from the task's media path when no API URL is given) and
+    segments are written back to the broker, so any number of workers can
+    run. With a Redis broker and an API URL, workers can run on any machine
+    that reaches both; with a SQLite broker they must run on the API's machine.
+
+    Args:
+        worker_id (str): Identifier reported to the broker (default: host-pid-random).
+        db_path (str): Broker database path or Redis URL (default: SUBTITLE_BROKER).
+        poll_interval (float): Seconds to wait when the queue is empty.
+        once (bool): Exit once the queue is empty instead of waiting for more work.
+        api_url (str): API base URL to fetch audio windows from (default: SUBTITLE_API_URL).
+    """
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    api_url = api_url or API_URL
+    models = {}
+    print(f" Worker {worker_id} started")
+
+    while True:
+        broker.register_worker(worker_id, db_path)
+        broker.requeue_stale_tasks(db_path=db_path)
+        task = broker.claim_task(worker_id, db_path)
+        if task is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"Translating: session {task['session_id']} chunk {task['chunk_index']}")
+        stop = threading.Event()
+        beat = threading.Thread(target=keep_alive, args=(task["id"], worker_id, stop, db_path), daemon=True)
+        beat.start()
+        try:
+            if task["model_size"] not in models:
+                models[task["model_size"]] = whisper.load_model(task["model_size"])
+            segments = run_task(models[task["model_size"]], task, api_url)
+            broker.complete_task(task["id"], worker_id, segments, db_path)
+        except Exception as e:
+            print(f" Task {task['id']} failed: {e}")
+            broker.fail_task(task["id"], worker_id, str(e), db_path)
+        finally:
+            stop.set()
+            beat.join()
+
+    print(f" Worker {worker_id} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Subtitle transcription worker")
+    parser.add_argument("--broker", default=broker.BROKER_PATH,
+                        help="Redis URL, or path to a SQLite job broker on this machine's local disk")
+    parser.add_argument("--api-url", default=API_URL, help="API base URL to fetch audio windows from")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    args = parser.parse_args()
+    run_worker(args.worker_id, args.broker, once=args.once, api_url=args.api_url)